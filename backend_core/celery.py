@@ -1,7 +1,6 @@
 import os
 
 from celery import Celery
-from celery.schedules import crontab
 from django.conf import settings 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_core.settings')
@@ -12,13 +11,32 @@ app = Celery('backend_core')
 app.config_from_object(settings, namespace='CELERY')
 app.autodiscover_tasks() 
 
+# Flush queued log records before prefork children exit (see backend_core/log.py)
+from backend_core.log import connect_celery_signals as connect_log_signals
+connect_log_signals()
+
+# On-demand profiling of sampled tasks (no-op unless switched on)
+from backend_core.profiling import connect_celery_signals
+connect_celery_signals()
+
+# Pool metrics from worker processes, and fork safety for prefork children (see backend_core/db.py)
+from backend_core.db import connect_celery_signals as connect_db_signals
+connect_db_signals()
+
 # Celery Beat Schedule for stale order detection
+# With a shared deadline index (orders/deadlines.py) the frequent job only pops due entries and the
+# table is read once per reconcile to repair drift; without one it reads the partial ETA index.
 app.conf.beat_schedule = {
-    'detect-stale-orders-every-minute': { # Name of the schedule
-        'task': 'orders.tasks.detect_and_handle_stale_orders', # Task to run
-        'schedule': crontab(minute='*/1'), # Run every minute for testing (adjust for prod)
+    'expire-due-orders': { # Name of the schedule
+        'task': 'orders.tasks.expire_due_orders', # Task to run
+        'schedule': settings.STALE_DEADLINE_POLL_SECONDS,
     },
 }
+if settings.STALE_DEADLINE_INDEX_URL: # Without a shared index there is nothing to reconcile
+    app.conf.beat_schedule['reconcile-deadline-index'] = {
+        'task': 'orders.tasks.reconcile_deadline_index',
+        'schedule': settings.STALE_DEADLINE_RECONCILE_MINUTES * 60,
+    }
 
 @app.task(bind=True)
 def debug_task(self):
@@ -0,0 +1,130 @@
+"""
+Database connection reuse for web and worker processes.
+
+With DB_POOL (the default on PostgreSQL) every process keeps a psycopg
+connection pool: each request (Django's request_finished) and each Celery task
+(the Django fixup's task_postrun) hands its connection back instead of closing
+it, and the next one borrows it. Without a pool, connections persist for
+DB_CONN_MAX_AGE seconds. Either way CONN_HEALTH_CHECKS makes Django check a
+connection before reusing it, so processes recover on their own after a
+database failover; DB_POOL_MAX_LIFETIME additionally recycles pooled
+connections so they follow a moved primary.
+
+A pool must never cross a fork: a gunicorn worker or Celery prefork child that
+inherited its parent's pool would share the parent's sockets. The fork hook
+below makes the child forget those objects (without closing them, which would
+end the parent's sessions) so it opens its own pool on first use.
+
+Metrics: `pool_stats()` reads the current process's pool. PoolStatsMiddleware
+and a Celery task_postrun hook log it as `db.pool_stats` at most every
+DB_POOL_STATS_INTERVAL seconds per process: pool size and idle connections,
+requests waiting, the number of borrows and the time spent waiting for a
+connection in that interval, pool timeouts and new connections opened.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# Pools and connections inherited from the parent process. Kept referenced so they are
+# never finalised (and their server sessions terminated) from the child.
+_inherited = []
+
+_last_report = {'at': float('-inf')}  # monotonic() may start near zero
+_report_lock = threading.Lock()
+
+# Counters that psycopg_pool only reports once they are non-zero
+_POOL_COUNTERS = [
+    'requests_num', 'requests_queued', 'requests_wait_ms', 'requests_errors', 'returns_bad',
+    'connections_num', 'connections_ms', 'connections_errors', 'connections_lost', 'usage_ms',
+]
+
+
+def _forget_inherited_connections():
+    if not settings.configured:
+        return
+    for wrapper in connections.all(initialized_only=True):
+        pools = getattr(type(wrapper), '_connection_pools', None)
+        if pools and wrapper.alias in pools:
+            _inherited.append(pools.pop(wrapper.alias))
+        if wrapper.connection is not None:
+            _inherited.append(wrapper.connection)
+            wrapper.connection = None
+    _last_report['at'] = float('-inf')
+
+
+os.register_at_fork(after_in_child=_forget_inherited_connections)
+
+
+def _pool(alias):
+    # Read the class-level registry rather than `wrapper.pool`, which would create a pool. Ad-hoc
+    # wrappers (benchmark_db_connections) aren't in `connections`; they share the default's class.
+    wrapper = connections[alias if alias in connections.settings else DEFAULT_DB_ALIAS]
+    pools = getattr(type(wrapper), '_connection_pools', None) or {}
+    return pools.get(alias)
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS, reset=False):
+    """
+    Gauges and counters of this process's pool, or None when it has none (pooling off or not used yet).
+    With reset=True the counters restart from zero, so each call covers the interval since the last one.
+    """
+    pool = _pool(alias)
+    if pool is None:
+        return None
+    raw = pool.pop_stats() if reset else pool.get_stats()
+    stats = {key: raw.get(key, 0) for key in ('pool_min', 'pool_max', 'pool_size', 'pool_available', 'requests_waiting')}
+    stats.update({key: raw.get(key, 0) for key in _POOL_COUNTERS})
+    stats['requests_avg_wait_ms'] = round(stats['requests_wait_ms'] / stats['requests_num'], 3) if stats['requests_num'] else 0.0
+    return stats
+
+
+def report_pool_stats(alias=DEFAULT_DB_ALIAS):
+    """Log this process's pool stats if DB_POOL_STATS_INTERVAL has passed since the last report."""
+    interval = settings.DB_POOL_STATS_INTERVAL
+    if not interval:
+        return
+    now = time.monotonic()
+    if now - _last_report['at'] < interval:
+        return
+    with _report_lock:
+        if now - _last_report['at'] < interval:
+            return
+        _last_report['at'] = now
+    try:
+        stats = pool_stats(alias, reset=True)
+    except Exception:
+        return  # Metrics must never fail a request or task
+    if stats is None:
+        return
+    # Waiting for a connection or timing out means the pool is too small: never sample that away
+    # (requests_queued counts the borrows that queued in the interval; requests_waiting is only this instant)
+    level = logging.WARNING if stats['requests_queued'] or stats['requests_errors'] else logging.INFO
+    logger.log(level, "Database pool stats", extra={'event': 'db.pool_stats', 'alias': alias, **stats})
+
+
+class PoolStatsMiddleware:
+    """Reports pool stats from web processes, piggybacking on requests (no extra thread)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        report_pool_stats()
+        return response
+
+
+def _task_postrun(**kwargs):
+    report_pool_stats()
+
+
+def connect_celery_signals():
+    from celery.signals import task_postrun
+
+    task_postrun.connect(_task_postrun, weak=False, dispatch_uid='db-pool-stats')
@@ -0,0 +1,171 @@
+"""
+Logging building blocks referenced from LOGGING in settings.py.
+
+* JsonFormatter: one JSON object per line, including any structured fields
+  passed via `extra=` (order_id, task, from_status, to_status, duration_ms, ...).
+* SamplingFilter: keeps a configurable fraction of routine (below WARNING)
+  events, per `event` name; warnings and errors are always kept.
+* NonBlockingHandler: queues records for a QueueListener thread that does
+  the formatting and the blocking stream write. The thread is started lazily in
+  each process, so it works in gunicorn workers and Celery prefork children
+  alike, which are forked after settings are loaded. Queued records are
+  written out when logging shuts down at exit; prefork children leave with
+  os._exit(), which skips that, so they flush on Celery's
+  worker_process_shutdown instead.
+"""
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import weakref
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_handlers = weakref.WeakSet()  # Every NonBlockingHandler, for flush_handlers()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes every record at WARNING and above. Lower-level records are kept with
+    probability `event_rates[record.event]`, falling back to `rate`.
+    """
+
+    def __init__(self, rate=1.0, event_rates=None):
+        super().__init__()
+        self.rate = rate
+        self.event_rates = event_rates or {}
+        self._random = random.Random()  # Own RNG: don't disturb seeded simulations
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.event_rates.get(getattr(record, 'event', None), self.rate)
+        return rate >= 1 or self._random.random() < rate
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # Wait for room rather than fail: the thread is draining the queue
+
+
+class NonBlockingHandler(logging.Handler):
+    """
+    Callers only pay for a queue put. When the queue is full, routine records are
+    dropped rather than blocking, and reported as one `log.dropped` warning once
+    there is room again. WARNING and above wait up to a second for room and are
+    then written on the caller's thread, so failures are never lost.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__()
+        self.queue = queue.Queue(queue_size)
+        self.queue_size = queue_size
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+        _handlers.add(self)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread, in the target handler
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's thread is gone; start over with a fresh queue
+            self.queue = queue.Queue(self.queue_size)
+            self._listener = _QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Write out every queued record and stop this process's listener thread, if it has one."""
+        with self._start_lock:
+            if self._pid == os.getpid() and self._listener is not None:
+                self._listener.stop()  # Drains the queue, then joins the thread
+            self._pid = self._listener = None
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def _report_dropped(self):
+        # emit() runs under the handler lock, so the counters need no lock of their own
+        count = self.dropped - self._reported_dropped
+        if count <= 0:
+            return
+        record = logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+            'msg': "Dropped routine log records, the log queue was full", 'event': 'log.dropped', 'count': count,
+        })
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            return
+        self._reported_dropped += count
+
+    def emit(self, record):
+        try:
+            self._ensure_listener()
+            # In-process queue: no pickling needed, only freeze the message so later
+            # mutation of the arguments can't change what gets logged
+            record.msg = record.getMessage()
+            record.args = None
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=1)
+                except queue.Full:
+                    self.target.handle(record)  # Blocking write rather than losing a failure
+            else:
+                self.queue.put_nowait(record)
+            self._report_dropped()
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+def flush_handlers():
+    """Write out the records queued in this process (see NonBlockingHandler.stop)."""
+    for handler in list(_handlers):
+        handler.stop()
+
+
+def _worker_process_shutdown(**kwargs):
+    flush_handlers()
+
+
+def connect_celery_signals():
+    from celery.signals import worker_process_shutdown
+
+    # Prefork children end with os._exit(), so atexit never runs there
+    worker_process_shutdown.connect(_worker_process_shutdown, weak=False, dispatch_uid='log-flush')
@@ -0,0 +1,264 @@
+"""
+On-demand profiling of HTTP endpoints and Celery tasks.
+
+Profiling is off by default and can be switched on at runtime (no redeploy)
+with `manage.py profiling enable`, which stores the config in the Django cache.
+Point CACHE_URL at Redis so every web and worker process sees it; otherwise
+only the PROFILING_* settings apply. A profiled call is chosen by target name
+(the URL name such as `order-list`, optionally prefixed with the method as in
+`GET order-list`, or the task name such as `orders.tasks.process_order_task`)
+and/or a sampling rate.
+
+For each profiled call we record, under PROFILING_DIR:
+
+* `<target>.folded`: stack samples in the folded format read by flamegraph.pl
+  and speedscope (`sample` mode, a background thread reads the stack every
+  PROFILING_SAMPLE_INTERVAL seconds), or `<target>/*.prof` cProfile dumps
+  (`cprofile` mode);
+* `<target>.calls.jsonl`: wall time plus SQL count and timings per call.
+
+`manage.py profiling summary` aggregates these into the hottest frames and
+queries per target.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+CONFIG_CACHE_KEY = 'profiling:config'
+
+_local_config = {'value': None, 'fetched_at': 0.0}
+_random = random.Random()
+
+
+def get_config():
+    """
+    The active profiling config: runtime config from the cache if present, else settings.
+    Kept in-process for PROFILING_CONFIG_TTL seconds so the check costs nothing per call.
+    """
+    now = time.monotonic()
+    if now - _local_config['fetched_at'] > settings.PROFILING_CONFIG_TTL:
+        try:
+            config = cache.get(CONFIG_CACHE_KEY)
+        except Exception:
+            config = None
+        if config is None:
+            config = {
+                'rate': settings.PROFILING_SAMPLE_RATE,
+                'targets': settings.PROFILING_TARGETS,
+                'mode': settings.PROFILING_MODE,
+                'until': None,
+            }
+        _local_config.update(value=config, fetched_at=now)
+    return _local_config['value']
+
+
+def set_config(rate, targets, mode, duration_seconds=None):
+    config = {
+        'rate': rate,
+        'targets': list(targets),
+        'mode': mode,
+        'until': time.time() + duration_seconds if duration_seconds else None,
+    }
+    cache.set(CONFIG_CACHE_KEY, config, timeout=duration_seconds)
+    return config
+
+
+def clear_config():
+    cache.set(CONFIG_CACHE_KEY, {'rate': 0.0, 'targets': [], 'mode': settings.PROFILING_MODE, 'until': None}, timeout=None)
+
+
+def should_profile(*names):
+    """Decide whether to profile a call known under any of `names`; returns the mode or None."""
+    config = get_config()
+    if config['until'] and time.time() > config['until']:
+        return None
+    targets = config['targets']
+    if targets and not any(name in targets for name in names):
+        return None
+    rate = config['rate']
+    if targets and rate <= 0:
+        rate = 1.0  # Targets without a rate: every matching call
+    if rate <= 0 or (rate < 1 and _random.random() >= rate):
+        return None
+    return config['mode']
+
+
+def safe_name(target):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', target).strip('_') or 'unnamed'
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    for prefix in sys.path:
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's call stack from a background thread and counts folded stacks."""
+
+    def __init__(self, thread_id, interval, max_depth=128):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class ProfileSession:
+    """One profiled call. start()/stop() rather than a context manager so Celery signals can drive it."""
+
+    def __init__(self, target, mode):
+        self.target = target
+        self.mode = mode
+        self.queries = defaultdict(lambda: [0, 0.0])  # sql -> [count, seconds]
+        self._exit_stack = contextlib.ExitStack()
+        self._sampler = None
+        self._profiler = None
+
+    def _record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            entry = self.queries[sql]
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+
+    def start(self):
+        self._exit_stack.enter_context(connection.execute_wrapper(self._record_query))
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:  # Another profiler is already active on this thread
+                self._profiler = None
+        else:
+            self._sampler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+            self._sampler.start()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        duration = time.perf_counter() - self._started
+        if self._profiler:
+            self._profiler.disable()
+        if self._sampler:
+            self._sampler.stop()
+        self._exit_stack.close()
+        try:
+            self._write(duration)
+        except OSError:
+            pass  # Never fail the request/task because the profile couldn't be written
+
+    def _write(self, duration):
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = safe_name(self.target)
+
+        if self._sampler and self._sampler.stacks:
+            with open(directory / f"{name}.folded", 'a') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self._sampler.stacks.items())
+        if self._profiler:
+            prof_dir = directory / name
+            prof_dir.mkdir(exist_ok=True)
+            self._profiler.dump_stats(prof_dir / f"{time.time():.6f}-{os.getpid()}.prof")
+
+        slowest = sorted(self.queries.items(), key=lambda kv: kv[1][1], reverse=True)[:10]
+        call = {
+            'ts': time.time(),
+            'target': self.target,
+            'mode': self.mode,
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': sum(count for count, _ in self.queries.values()),
+            'query_ms': round(sum(seconds for _, seconds in self.queries.values()) * 1000, 3),
+            'queries': [[sql, count, round(seconds * 1000, 3)] for sql, (count, seconds) in slowest],
+        }
+        with open(directory / f"{name}.calls.jsonl", 'a') as f:
+            f.write(json.dumps(call) + '\n')
+
+
+class ProfilingMiddleware:
+    """Profiles sampled requests, named after the resolved URL name (e.g. `order-list`)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        if not config['targets'] and config['rate'] <= 0:
+            return self.get_response(request)  # Fast path: profiling is off
+
+        try:
+            match = resolve(request.path_info)
+            target = match.view_name or match._func_path
+        except Resolver404:
+            return self.get_response(request)
+
+        mode = should_profile(target, f"{request.method} {target}")
+        if not mode:
+            return self.get_response(request)
+
+        session = ProfileSession(f"{request.method} {target}", mode)
+        session.start()
+        try:
+            return self.get_response(request)
+        finally:
+            session.stop()
+
+
+# --- Celery hooks ---
+_task_sessions = {}
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    mode = should_profile(task.name)
+    if mode:
+        session = ProfileSession(task.name, mode)
+        session.start()
+        _task_sessions[task_id] = session
+
+
+def _task_postrun(task_id=None, **kwargs):
+    session = _task_sessions.pop(task_id, None)
+    if session:
+        session.stop()
+
+
+def connect_celery_signals():
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(_task_prerun, weak=False, dispatch_uid='profiling-prerun')
+    task_postrun.connect(_task_postrun, weak=False, dispatch_uid='profiling-postrun')
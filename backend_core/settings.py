@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend_core.profiling.ProfilingMiddleware', # No-op unless profiling is switched on
+    'backend_core.db.PoolStatsMiddleware', # Periodic db.pool_stats log; no-op without a pool
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,9 +100,49 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True, # Check a reused connection first, so processes recover after a failover
     }
 }
 
+# Connection reuse (backend_core/db.py): with DB_POOL every gunicorn worker and Celery child keeps a
+# psycopg pool (requires psycopg[pool]); otherwise connections persist for DB_CONN_MAX_AGE seconds.
+# Size pools so that processes x DB_POOL_MAX_SIZE stays below the server's max_connections.
+DB_POOL = (
+    DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+    and os.getenv('DB_POOL', 'True').lower() in ('true', '1', 't')
+)
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)), # Seconds to wait for a free connection before erroring
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)), # Close connections idle for this long (down to min_size)
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)), # Recycle connections, e.g. to follow a failover
+        },
+    }
+    DATABASES['default']['CONN_MAX_AGE'] = 0 # Pooling replaces persistent connections
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_POOL_STATS_INTERVAL = int(os.getenv('DB_POOL_STATS_INTERVAL', 60)) # Seconds between db.pool_stats logs per process (0 = off)
+
+# Cache
+# The circuit breaker needs a cache shared by all workers; point CACHE_URL at Redis in production.
+# Without it each process gets its own local-memory cache.
+if os.getenv('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema', 
     # 'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -112,6 +154,63 @@ REST_FRAMEWORK = {
 }
 
 
+# Logging
+# Structured JSON lines written from a background thread (backend_core/log.py). Routine INFO events
+# can be sampled; warnings and errors (failed orders, retries, exhausted retries) are always kept.
+# The same config is used by gunicorn workers and Celery workers (see CELERY_WORKER_HIJACK_ROOT_LOGGER).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0)) # Fraction of routine events kept
+LOG_EVENT_SAMPLE_RATES = { # Per-event overrides for the high-frequency success events
+    'order.status_changed': float(os.getenv('LOG_STATUS_CHANGE_SAMPLE_RATE', LOG_SAMPLE_RATE)),
+    'task.completed': float(os.getenv('LOG_TASK_COMPLETED_SAMPLE_RATE', LOG_SAMPLE_RATE)),
+    'db.pool_stats': 1.0, # Already rate-limited by DB_POOL_STATS_INTERVAL
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'backend_core.log.JsonFormatter'},
+    },
+    'filters': {
+        'sampled': {
+            '()': 'backend_core.log.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+            'event_rates': LOG_EVENT_SAMPLE_RATES,
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'backend_core.log.NonBlockingHandler',
+            'formatter': 'json',
+            'filters': ['sampled'],
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'orders': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        'products': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        'backend_core': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        'django': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        # Per-task "succeeded in" lines duplicate the sampled task.completed events; keep Celery to warnings
+        'celery': {'handlers': ['console'], 'level': os.getenv('CELERY_LOG_LEVEL', 'WARNING'), 'propagate': False},
+    },
+}
+
+
+# On-demand profiling (backend_core/profiling.py); switch on at runtime with `manage.py profiling enable`.
+# These are the defaults used when no runtime config is in the cache.
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0)) # Fraction of calls profiled (0 = off, or every call to PROFILING_TARGETS)
+PROFILING_TARGETS = [t.strip() for t in os.getenv('PROFILING_TARGETS', '').split(',') if t.strip()] # URL or task names
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'sample') # 'sample' (stack sampling) or 'cprofile'
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', 0.005)) # Seconds between stack samples
+PROFILING_CONFIG_TTL = 5 # Seconds each process caches the runtime config
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -160,6 +259,7 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False # Keep the LOGGING config above in worker processes
 
 # Simulated delays (in seconds)
 ORDER_PROCESSING_DELAY_MIN = 5
@@ -169,9 +269,43 @@ ORDER_SHIPPING_DELAY_MAX = 30
 ORDER_DELIVERY_DELAY_MIN = 20
 ORDER_DELIVERY_DELAY_MAX = 60
 
+# Lifecycle task retries: exponential backoff with full jitter, starting from each
+# task's default_retry_delay and capped at this many seconds
+TASK_RETRY_BACKOFF_MAX = int(os.getenv('TASK_RETRY_BACKOFF_MAX', 600))
+
+# Database circuit breaker shared by the lifecycle tasks (state lives in the default cache).
+# Opens after THRESHOLD transient DB errors within WINDOW seconds, probes again after RESET seconds.
+DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD', 20))
+DB_CIRCUIT_BREAKER_WINDOW_SECONDS = int(os.getenv('DB_CIRCUIT_BREAKER_WINDOW_SECONDS', 30))
+DB_CIRCUIT_BREAKER_RESET_SECONDS = int(os.getenv('DB_CIRCUIT_BREAKER_RESET_SECONDS', 30))
+
+# Multi-location allocation (orders/allocation.py): 'single-location-first', 'least-contended',
+# 'split-shipment' or a dotted path to an AllocationStrategy subclass. Only the latter two spread a hot
+# SKU's orders over several locations' rows; the default keeps them on one row (README, section 14).
+INVENTORY_ALLOCATION_STRATEGY = os.getenv('INVENTORY_ALLOCATION_STRATEGY', 'single-location-first')
+INVENTORY_ALLOCATION_ATTEMPTS = int(os.getenv('INVENTORY_ALLOCATION_ATTEMPTS', 3)) # Optimistic tries before locking all of a product's rows
+
+# Backorders (orders/backorders.py): park orders that are short of stock as BACKORDERED instead of
+# failing them, and allocate to them oldest first when the product is restocked
+ORDER_BACKORDERS_ENABLED = os.getenv('ORDER_BACKORDERS_ENABLED', 'False').lower() in ('true', '1', 't')
+ORDER_BACKORDER_BATCH_SIZE = int(os.getenv('ORDER_BACKORDER_BATCH_SIZE', 500)) # Waiting orders considered per allocation pass
+
+# Cancellation (orders/cancellation.py): orders per transaction, and ids accepted by POST /api/orders/cancel/
+ORDER_CANCEL_BATCH_SIZE = int(os.getenv('ORDER_CANCEL_BATCH_SIZE', 1000))
+ORDER_CANCEL_MAX_IDS = int(os.getenv('ORDER_CANCEL_MAX_IDS', 20000))
+
 # Stale order threshold (in minutes)
 STALE_ORDER_THRESHOLD_MINUTES = 3 # For quick testing, normally much higher
 
+# Maximum number of order ids accepted by POST /api/orders/status/
+ORDER_STATUS_BATCH_MAX_IDS = int(os.getenv('ORDER_STATUS_BATCH_MAX_IDS', 5000))
+
+# Stale order deadline index (orders/deadlines.py)
+# Redis sorted set shared by web and worker processes; without a URL expiry queries the database (order_in_flight_eta_idx)
+STALE_DEADLINE_INDEX_URL = os.getenv('STALE_DEADLINE_INDEX_URL')
+STALE_DEADLINE_POLL_SECONDS = int(os.getenv('STALE_DEADLINE_POLL_SECONDS', 5)) # Max delay between an ETA passing and the order expiring
+STALE_DEADLINE_RECONCILE_MINUTES = int(os.getenv('STALE_DEADLINE_RECONCILE_MINUTES', 30)) # Full rebuild from the DB to repair drift
+
 
 # swagger collection
 SPECTACULAR_SETTINGS = {
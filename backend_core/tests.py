@@ -0,0 +1,253 @@
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from products.models import Product
+
+from .db import _last_report, pool_stats, report_pool_stats
+from .log import JsonFormatter, NonBlockingHandler, SamplingFilter, flush_handlers
+from .profiling import CONFIG_CACHE_KEY, ProfileSession, set_config, should_profile
+
+
+def make_record(level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord('orders.tasks', level, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class JsonFormatterTests(SimpleTestCase):
+    def test_structured_fields_and_exceptions(self):
+        record = make_record(event='task.completed', order_id='abc', duration_ms=1.5)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record.exc_info = sys.exc_info()
+
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual((payload['level'], payload['logger'], payload['msg']), ('INFO', 'orders.tasks', "hello world"))
+        self.assertEqual((payload['event'], payload['order_id'], payload['duration_ms']), ('task.completed', 'abc', 1.5))
+        self.assertIn("ValueError: boom", payload['exc'])
+        self.assertNotIn('args', payload)
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def test_rates(self):
+        sampled = SamplingFilter(rate=0, event_rates={'order.status_changed': 1.0})
+        self.assertFalse(sampled.filter(make_record(event='task.completed')))
+        self.assertTrue(sampled.filter(make_record(event='order.status_changed')))
+        self.assertTrue(sampled.filter(make_record(logging.WARNING, event='task.completed')))  # Failures always kept
+
+        half = SamplingFilter(rate=0.5)
+        half._random.seed(1)
+        kept = sum(half.filter(make_record()) for _ in range(1000))
+        self.assertTrue(400 < kept < 600, kept)
+
+
+class NonBlockingHandlerTests(SimpleTestCase):
+    def make_handler(self, **kwargs):
+        stream = io.StringIO()
+        handler = NonBlockingHandler(stream=stream, **kwargs)
+        handler.setFormatter(JsonFormatter())
+        self.addCleanup(handler.close)
+        return handler, stream
+
+    def lines(self, stream):
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_records_are_written_by_the_listener_and_flushed_on_stop(self):
+        handler, stream = self.make_handler()
+        args = ["before"]
+        handler.handle(make_record(msg="value %s", args=(args,)))
+        args[0] = "after"  # Mutating the arguments later can't change what was logged
+        flush_handlers()
+        self.assertEqual([line['msg'] for line in self.lines(stream)], ["value ['before']"])
+
+        handler.handle(make_record(msg="restarted", args=()))  # A stopped handler starts over on the next record
+        handler.stop()
+        self.assertEqual(self.lines(stream)[-1]['msg'], "restarted")
+
+    def test_full_queue_drops_routine_records_but_not_failures(self):
+        handler, stream = self.make_handler(queue_size=2)
+        handler.handle(make_record(msg="first", args=()))
+        listener_queue = handler.queue
+        handler.queue = queue.Queue(1)  # Nothing drains this one: it stays full
+        handler.queue.put_nowait(make_record(msg="stuck", args=()))
+
+        handler.handle(make_record(msg="routine", args=()))
+        self.assertEqual(handler.dropped, 1)
+        handler.handle(make_record(logging.ERROR, msg="failure", args=()))  # Written on this thread after the timeout
+        self.assertIn("failure", stream.getvalue())
+
+        handler.queue = listener_queue  # Room again: the drop is reported with the next record
+        handler.handle(make_record(msg="later", args=()))
+        handler.stop()
+        lines = self.lines(stream)
+        self.assertNotIn("routine", [line['msg'] for line in lines])
+        [dropped] = [line for line in lines if line.get('event') == 'log.dropped']
+        self.assertEqual((dropped['level'], dropped['count']), ('WARNING', 1))
+
+
+@override_settings(PROFILING_CONFIG_TTL=-1)  # Re-read the config on every call
+class ShouldProfileTests(SimpleTestCase):
+    def setUp(self):
+        cache.delete(CONFIG_CACHE_KEY)
+        self.addCleanup(cache.delete, CONFIG_CACHE_KEY)
+
+    def test_off_by_default(self):
+        self.assertIsNone(should_profile('order-list'))
+
+    @override_settings(PROFILING_TARGETS=['GET order-list'], PROFILING_SAMPLE_RATE=0)
+    def test_targets_without_a_rate_profile_every_matching_call(self):
+        self.assertTrue(all(should_profile('order-list', 'GET order-list') == 'sample' for _ in range(20)))
+        self.assertIsNone(should_profile('order-detail', 'GET order-detail'))
+
+    def test_runtime_config_rate_and_expiry(self):
+        set_config(0.5, ['orders.tasks.ship_order_task'], 'cprofile')
+        profiled = [should_profile('orders.tasks.ship_order_task') for _ in range(400)]
+        self.assertEqual(set(profiled), {'cprofile', None})
+        self.assertIsNone(should_profile('orders.tasks.deliver_order_task'))
+
+        set_config(1.0, [], 'sample', duration_seconds=60)
+        self.assertEqual(should_profile('anything'), 'sample')
+        with mock.patch('backend_core.profiling.time.time', return_value=time.time() + 61):
+            self.assertIsNone(should_profile('anything'))
+
+
+class ProfileSessionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(PROFILING_DIR=directory.name, PROFILING_SAMPLE_INTERVAL=0.001)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def profile(self, mode):
+        session = ProfileSession('GET order-list', mode)
+        session.start()
+        with connection.cursor() as cursor:
+            for _ in range(3):
+                cursor.execute("SELECT 1")
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:  # Give the sampler something to see
+            pass
+        session.stop()
+
+    def test_sample_mode_writes_folded_stacks_and_calls(self):
+        self.profile('sample')
+        self.profile('sample')
+
+        folded = (self.directory / 'GET_order-list.folded').read_text().splitlines()
+        self.assertTrue(folded)
+        for line in folded:
+            stack, _, count = line.rpartition(' ')
+            self.assertGreater(int(count), 0)
+            self.assertIn('profile (backend_core/tests.py:', stack)
+
+        calls = [json.loads(line) for line in (self.directory / 'GET_order-list.calls.jsonl').read_text().splitlines()]
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((calls[0]['target'], calls[0]['mode'], calls[0]['query_count']), ('GET order-list', 'sample', 3))
+        self.assertEqual(calls[0]['queries'][0][:2], ["SELECT 1", 3])
+        self.assertGreaterEqual(calls[0]['duration_ms'], 50)
+
+        out = io.StringIO()
+        call_command('profiling', 'summary', '--top', '5', stdout=out)
+        summary = out.getvalue()
+        self.assertIn('GET_order-list', summary)
+        self.assertIn('calls: 2', summary)
+        self.assertIn('SELECT 1', summary)
+        self.assertIn('stack samples:', summary)
+        self.assertIn('profile (backend_core/tests.py:', summary)
+
+    def test_cprofile_mode_writes_dumps(self):
+        self.profile('cprofile')
+        self.assertEqual(len(list((self.directory / 'GET_order-list').glob('*.prof'))), 1)
+        self.assertFalse((self.directory / 'GET_order-list.folded').exists())
+
+        out = io.StringIO()
+        call_command('profiling', 'summary', '--target', 'GET_order', stdout=out)
+        self.assertIn('cProfile dumps: 1', out.getvalue())
+        self.assertIn('calls: 1', out.getvalue())
+
+
+class PoolStatsTests(TestCase):
+    def setUp(self):
+        _last_report['at'] = float('-inf')
+        self.addCleanup(_last_report.update, at=float('-inf'))
+
+    def stats(self, **counters):
+        return {'pool_size': 4, 'pool_available': 2, 'requests_waiting': 0, 'requests_queued': 0, 'requests_errors': 0, **counters}
+
+    def test_alias_without_a_pool(self):
+        # Ad-hoc aliases such as benchmark_db_connections' are not in `connections`
+        self.assertIsNone(pool_stats('benchmark_unused'))
+
+    @override_settings(DB_POOL_STATS_INTERVAL=60)
+    def test_reports_at_most_once_per_interval(self):
+        with mock.patch('backend_core.db.pool_stats', return_value=self.stats()) as stats, \
+                mock.patch('backend_core.db.time.monotonic', return_value=1000.0) as monotonic:
+            with self.assertLogs('backend_core.db', logging.INFO) as logs:
+                report_pool_stats()
+                report_pool_stats()
+                monotonic.return_value += 59
+                report_pool_stats()
+                monotonic.return_value += 1
+                report_pool_stats()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual([call.kwargs for call in stats.call_args_list], [{'reset': True}] * 2)  # Each covers one interval
+        self.assertEqual(logs.records[0].event, 'db.pool_stats')
+
+    @override_settings(DB_POOL_STATS_INTERVAL=0)
+    def test_interval_zero_switches_reports_off(self):
+        with mock.patch('backend_core.db.pool_stats') as stats:
+            report_pool_stats()
+        stats.assert_not_called()
+
+    @override_settings(DB_POOL_STATS_INTERVAL=60)
+    def test_warns_when_requests_queued_or_timed_out(self):
+        cases = [
+            ({}, logging.INFO),
+            ({'requests_waiting': 1}, logging.INFO),  # A gauge: a request queued right now is counted in requests_queued
+            ({'requests_queued': 3}, logging.WARNING),
+            ({'requests_errors': 1}, logging.WARNING),
+        ]
+        for counters, level in cases:
+            _last_report['at'] = float('-inf')
+            with self.subTest(**counters), mock.patch('backend_core.db.pool_stats', return_value=self.stats(**counters)):
+                with self.assertLogs('backend_core.db', logging.INFO) as logs:
+                    report_pool_stats()
+                self.assertEqual([record.levelno for record in logs.records], [level])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs fork()")
+    def test_forked_child_forgets_the_parents_connections(self):
+        Product.objects.exists()  # Make sure the parent holds a connection (and, with DB_POOL, a pool)
+        wrapper = connections[DEFAULT_DB_ALIAS]
+        self.assertIsNotNone(wrapper.connection)
+        _last_report['at'] = 1000.0
+
+        pid = os.fork()
+        if pid == 0:
+            pools = getattr(type(wrapper), '_connection_pools', None) or {}
+            forgotten = wrapper.connection is None and DEFAULT_DB_ALIAS not in pools and _last_report['at'] == float('-inf')
+            os._exit(0 if forgotten else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+        # The child only forgot them: the parent's session is still open
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), (1,))
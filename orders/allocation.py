@@ -0,0 +1,203 @@
+"""
+Allocation engine: decides which inventory rows (a product at a location) an
+order's units are taken from.
+
+The strategy is set with INVENTORY_ALLOCATION_STRATEGY, by name or as a dotted
+path to your own `AllocationStrategy` subclass:
+
+* `single-location-first`: ship the whole order from one location when any
+  location can (lowest `Location.priority` first), else split by priority.
+* `least-contended`: per product, pick a row that can fill the line, at random
+  weighted by stock, so concurrent orders for a popular SKU lock different
+  rows. Rows another transaction holds are skipped (`SKIP LOCKED`) rather than
+  waited for.
+* `split-shipment`: fill each product from its fullest rows, splitting a line
+  across locations whenever that helps.
+
+`allocate_order` plans on an unlocked snapshot and then locks only the rows
+the plan uses. If one of them changed or (least-contended) is busy, the
+attempt's savepoint is rolled back, releasing its locks, and the order is
+re-planned without those rows. After INVENTORY_ALLOCATION_ATTEMPTS - 1 such
+attempts, or when the snapshot looks short, it falls back to locking all of
+the products' rows and planning on what is really there, as single-row
+inventory always did.
+"""
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from products.models import Inventory
+
+from .inventory import adjust_stock, load_stock, lock_rows
+from .models import Allocation
+
+
+class AllocationStrategy:
+    name = None
+    skip_locked = False  # Skip rows held by other transactions instead of waiting for them
+
+    def plan(self, demand, stock):
+        """
+        Return [(StockRow, units)] covering `demand` ({product_id: units}) from `stock`
+        ({product_id: [StockRow]}), or None if some product doesn't have enough in total.
+        Must not modify `stock`.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def fill(quantity, rows):
+        """Take `quantity` units from `rows` in the given order; None if they don't hold enough."""
+        plan = []
+        for row in rows:
+            if quantity <= 0:
+                break
+            units = min(row.available, quantity)
+            if units > 0:
+                plan.append((row, units))
+                quantity -= units
+        return plan if quantity <= 0 else None
+
+    def split(self, demand, stock, key):
+        plan = []
+        for product_id, quantity in demand.items():
+            lines = self.fill(quantity, sorted(stock.get(product_id, []), key=key))
+            if lines is None:
+                return None
+            plan.extend(lines)
+        return plan
+
+
+class SingleLocationFirst(AllocationStrategy):
+    name = 'single-location-first'
+
+    def plan(self, demand, stock):
+        by_location = {}
+        for rows in stock.values():
+            for row in rows:
+                by_location.setdefault(row.location_id, {})[row.product_id] = row
+        complete = [
+            rows for rows in by_location.values()
+            if all(product_id in rows and rows[product_id].available >= quantity for product_id, quantity in demand.items())
+        ]
+        if complete:
+            best = min(complete, key=lambda rows: min((row.priority, row.location_id) for row in rows.values()))
+            return [(best[product_id], quantity) for product_id, quantity in demand.items()]
+        return self.split(demand, stock, key=lambda row: (row.priority, row.location_id))
+
+
+class LeastContended(AllocationStrategy):
+    name = 'least-contended'
+    skip_locked = True
+
+    def __init__(self):
+        self._random = random.Random()
+
+    def plan(self, demand, stock):
+        plan = []
+        for product_id, quantity in demand.items():
+            rows = stock.get(product_id, [])
+            whole = [row for row in rows if row.available >= quantity]
+            if whole:
+                plan.append((self._random.choices(whole, weights=[row.available for row in whole])[0], quantity))
+                continue
+            lines = self.fill(quantity, sorted(rows, key=lambda row: -row.available))
+            if lines is None:
+                return None
+            plan.extend(lines)
+        return plan
+
+
+class SplitShipment(AllocationStrategy):
+    name = 'split-shipment'
+
+    def plan(self, demand, stock):
+        return self.split(demand, stock, key=lambda row: (-row.available, row.location_id))
+
+
+ALLOCATION_STRATEGIES = {cls.name: cls for cls in (SingleLocationFirst, LeastContended, SplitShipment)}
+
+_strategies = {}
+
+
+def get_allocation_strategy(name=None):
+    name = name or settings.INVENTORY_ALLOCATION_STRATEGY
+    if name not in _strategies:
+        _strategies[name] = (ALLOCATION_STRATEGIES.get(name) or import_string(name))()
+    return _strategies[name]
+
+
+def reserve(plan):
+    """Deduct a plan from the in-memory stock it was made from, for planning several orders in a row."""
+    for row, units in plan:
+        row.available -= units
+
+
+def apply_allocations(plans):
+    """Persist [(order_id, plan)]: one UPDATE for all inventory rows, one INSERT for the Allocation rows."""
+    deltas = Counter()
+    allocations = Counter()
+    for order_id, plan in plans:
+        for row, units in plan:
+            deltas[row.inventory_id] -= units
+            allocations[order_id, row.inventory_id] += units
+    adjust_stock(deltas)
+    Allocation.objects.bulk_create(
+        Allocation(order_id=order_id, inventory_id=inventory_id, quantity=units)
+        for (order_id, inventory_id), units in allocations.items()
+    )
+
+
+def shortages(demand, stock):
+    """{product_id: units available} for every product in `demand` that can't be filled."""
+    available = {product_id: sum(row.available for row in rows) for product_id, rows in stock.items()}
+    return {
+        product_id: available.get(product_id, 0)
+        for product_id, quantity in demand.items() if available.get(product_id, 0) < quantity
+    }
+
+
+class _Conflict(Exception):
+    def __init__(self, inventory_ids):
+        super().__init__(inventory_ids)
+        self.inventory_ids = inventory_ids
+
+
+def allocate_order(order, demand, strategy=None):
+    """
+    Take `demand` ({product_id: units}) for `order`, all or nothing. Call inside a transaction.
+    Returns {} on success, else the shortages ({product_id: units available}) with nothing taken.
+    Raises Inventory.DoesNotExist if a product has no inventory at all.
+    """
+    strategy = strategy or get_allocation_strategy()
+    excluded = set()
+    for _ in range(max(settings.INVENTORY_ALLOCATION_ATTEMPTS - 1, 0)):
+        plan = strategy.plan(demand, load_stock(demand, exclude=excluded))
+        if plan is None:
+            break  # Short, or only the excluded rows could fill it: settle it under lock
+        taken = Counter()
+        for row, units in plan:
+            taken[row.inventory_id] += units
+        try:
+            with transaction.atomic():  # Savepoint: rolling back releases this attempt's row locks
+                locked = lock_rows(sorted(taken), skip_locked=strategy.skip_locked)
+                conflicts = [inventory_id for inventory_id, units in taken.items()
+                             if inventory_id not in locked or locked[inventory_id].available < units]
+                if conflicts:
+                    raise _Conflict(conflicts)
+                apply_allocations([(order.pk, plan)])
+                return {}
+        except _Conflict as conflict:
+            excluded.update(conflict.inventory_ids)
+
+    stock = load_stock(demand, lock=True)
+    missing = set(demand) - set(stock)
+    if missing and len(set(Inventory.objects.filter(product_id__in=missing).values_list('product_id', flat=True))) < len(missing):
+        raise Inventory.DoesNotExist(f"No inventory for products {sorted(missing)}")
+    plan = strategy.plan(demand, stock)
+    if plan is None:
+        return shortages(demand, stock)
+    apply_allocations([(order.pk, plan)])
+    return {}
@@ -0,0 +1,130 @@
+"""
+Backorder queue, enabled with ORDER_BACKORDERS_ENABLED.
+
+An order that is short of stock in process_order_task moves to BACKORDERED
+instead of FAILED, with one `Backorder` row per product it is waiting for.
+When a product is restocked, `allocate_backorders` serves the waiting orders
+oldest first in one batched pass: a handful of queries for the whole batch
+rather than a process_order_task run per order.
+
+Allocation is all-or-nothing per order, like process_order_task. FIFO is
+strict per product: once an older order cannot be served, younger orders may
+not take the products it is short of, so large orders are not starved by a
+stream of small ones.
+"""
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+
+from .allocation import apply_allocations, get_allocation_strategy, reserve
+from .clock import get_clock
+from .inventory import demand_by_product, load_stock
+from .models import Backorder, Order, OrderItem, bulk_update_order_status, update_order_status
+
+logger = logging.getLogger(__name__)
+
+
+def backorder_order(order, product_ids, notes):
+    """Park an order in the queue of every product it is short of. Call inside the allocating transaction."""
+    update_order_status(order, Order.OrderStatus.BACKORDERED, notes=notes)
+    Backorder.objects.bulk_create(
+        [Backorder(order=order, product_id=product_id) for product_id in product_ids],
+        ignore_conflicts=True,
+    )
+
+
+def notify_restock(product_ids):
+    """Schedule an allocation pass for restocked products once the restock commits."""
+    if not settings.ORDER_BACKORDERS_ENABLED or not product_ids:
+        return
+    from .tasks import allocate_backorders_task
+
+    product_ids = sorted(set(product_ids))
+    transaction.on_commit(lambda: get_clock().enqueue(allocate_backorders_task, product_ids))
+
+
+def allocate_backorders(product_ids, batch_size):
+    """
+    Allocate stock to up to `batch_size` of the oldest orders waiting for any of `product_ids`.
+    Returns (allocated order ids, whether the batch was full and more orders may be waiting).
+    """
+    with transaction.atomic():
+        queue = (
+            Backorder.objects.filter(product_id__in=product_ids, order__status=Order.OrderStatus.BACKORDERED)
+            .values('order_id')
+            .annotate(queued_at=Min('created_at'))
+            .order_by('queued_at', 'order_id')
+        )
+        order_ids = [row['order_id'] for row in queue[:batch_size]]
+        if not order_ids:
+            return [], False
+
+        # Orders first (in pk order), then inventory: the same lock order as cancellation
+        orders = {order.pk: order for order in Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk')}
+        waiting = [order_id for order_id in order_ids
+                   if order_id in orders and orders[order_id].status == Order.OrderStatus.BACKORDERED]
+
+        lines = {}
+        for order_id, product_id, quantity in OrderItem.objects.filter(order_id__in=waiting).values_list('order_id', 'product_id', 'quantity'):
+            lines.setdefault(order_id, []).append((product_id, quantity))
+        demands = {order_id: demand_by_product(lines.get(order_id, [])) for order_id in waiting}
+
+        # One batched pass locks every row involved up front and plans all orders against it
+        stock = load_stock({product_id for demand in demands.values() for product_id in demand}, lock=True)
+        available = {product_id: sum(row.available for row in rows) for product_id, rows in stock.items()}
+        strategy = get_allocation_strategy()
+
+        allocated = []
+        plans = []
+        blocked = set()  # Products an older order is still waiting for
+        waits = []  # (order, product) pairs a skipped order now waits on
+        for order_id in waiting:
+            demand = demands[order_id]
+            short = [product_id for product_id, quantity in demand.items()
+                     if product_id in blocked or available.get(product_id, 0) < quantity]
+            plan = None if short else strategy.plan(demand, stock)
+            if plan is None:
+                blocked.update(short or demand)
+                waits.extend((order_id, product_id) for product_id in short or demand)
+                continue
+            reserve(plan)
+            for product_id, quantity in demand.items():
+                available[product_id] -= quantity
+            plans.append((order_id, plan))
+            allocated.append(order_id)
+
+        # The order may now be short of a product it was not queued for (sold out since it was
+        # backordered); queue it there too, or restocking that product would never find it
+        Backorder.objects.bulk_create(
+            [Backorder(order_id=order_id, product_id=product_id) for order_id, product_id in waits],
+            ignore_conflicts=True,
+        )
+        if not allocated:
+            return [], len(order_ids) == batch_size
+
+        # One UPDATE for every decremented inventory row, one INSERT for the allocations
+        apply_allocations(plans)
+        bulk_update_order_status(
+            [orders[order_id] for order_id in allocated],
+            Order.OrderStatus.PACKAGING,
+            notes="Backorder filled after restock, order is being packaged.",
+            expected_eta_delta_seconds=int(settings.ORDER_SHIPPING_DELAY_MAX * 1.5), # Time for packaging + shipping
+        )
+        Backorder.objects.filter(order_id__in=allocated).delete()
+
+        # Only hand the orders to the shipping task once they are committed as PACKAGING
+        transaction.on_commit(lambda: _enqueue_shipping(allocated))
+
+    logger.info("Allocated backorders", extra={
+        'event': 'backorders.allocated', 'count': len(allocated), 'considered': len(order_ids),
+        'product_ids': list(product_ids),
+    })
+    return allocated, len(order_ids) == batch_size
+
+
+def _enqueue_shipping(order_ids):
+    from .tasks import ship_order_task  # tasks imports this module
+
+    for order_id in order_ids:
+        get_clock().enqueue(ship_order_task, order_id)
@@ -0,0 +1,81 @@
+"""
+Order cancellation, single or in bulk (e.g. after a fraud event).
+
+Orders that are not yet SHIPPED (Order.CANCELABLE_STATUSES) are canceled in
+batches of ORDER_CANCEL_BATCH_SIZE, one transaction per batch:
+
+1. lock the batch's order rows (in pk order) and keep the cancelable ones;
+2. release the stock held by PACKAGING orders back to the locations it was
+   allocated from, with one aggregated `UPDATE ... CASE` over all affected
+   inventory rows;
+3. drop BACKORDERED orders from the backorder queues;
+4. move the orders to CANCELED with one UPDATE and one bulk history insert.
+
+Tasks already queued for these orders become no-ops: each lifecycle task
+re-reads its order under a row lock and skips it unless it is still in the
+status the task expects.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .backorders import notify_restock
+from .inventory import adjust_stock, lock_rows
+from .models import Allocation, Backorder, Order, bulk_update_order_status
+
+logger = logging.getLogger(__name__)
+
+
+def cancel_orders(order_ids, notes="Order canceled.", batch_size=None):
+    """
+    Cancel the given orders where possible. Returns a dict with the `canceled` ids,
+    `not_cancelable` ({id: status} for orders already SHIPPED or final) and `not_found` ids.
+    """
+    batch_size = batch_size or settings.ORDER_CANCEL_BATCH_SIZE
+    order_ids = sorted(set(order_ids))
+    result = {'canceled': [], 'not_cancelable': {}, 'not_found': []}
+
+    for start in range(0, len(order_ids), batch_size):
+        chunk = order_ids[start:start + batch_size]
+        with transaction.atomic():
+            orders = list(Order.objects.select_for_update().filter(pk__in=chunk).order_by('pk'))
+            found = {order.pk for order in orders}
+            result['not_found'].extend(order_id for order_id in chunk if order_id not in found)
+
+            to_cancel = []
+            for order in orders:
+                if order.status in Order.CANCELABLE_STATUSES:
+                    to_cancel.append(order)
+                else:
+                    result['not_cancelable'][order.pk] = order.status
+            if not to_cancel:
+                continue
+
+            # Stock is allocated in the same transaction that moves an order to PACKAGING;
+            # each unit goes back to the inventory row (location) it was taken from
+            allocated = [order.pk for order in to_cancel if order.status == Order.OrderStatus.PACKAGING]
+            released = dict(
+                Allocation.objects.filter(order_id__in=allocated)
+                .values('inventory_id').annotate(units=Sum('quantity'))
+                .values_list('inventory_id', 'units')
+            ) if allocated else {}
+            if released:
+                rows = lock_rows(sorted(released))
+                adjust_stock(released)
+                Allocation.objects.filter(order_id__in=allocated).delete()
+                notify_restock({row.product_id for row in rows.values()}) # The released stock may fill waiting backorders
+
+            backordered = [order.pk for order in to_cancel if order.status == Order.OrderStatus.BACKORDERED]
+            if backordered:
+                Backorder.objects.filter(order_id__in=backordered).delete()
+
+            bulk_update_order_status(to_cancel, Order.OrderStatus.CANCELED, notes=notes)
+            result['canceled'].extend(order.pk for order in to_cancel)
+
+        logger.info("Canceled orders", extra={
+            'event': 'orders.canceled', 'count': len(to_cancel), 'released_rows': len(released),
+        })
+
+    return result
@@ -0,0 +1,47 @@
+"""
+Clock used by the order lifecycle code for "now", simulated delays,
+enqueuing the next task and scheduling retries.
+
+By default this is the wall clock plus Celery. The simulation engine
+(`orders/simulation.py`) swaps in a virtual clock so the exact same task code
+can be driven by an in-process scheduler instead of real time.
+"""
+import contextlib
+import time
+
+from django.utils import timezone
+
+
+class SystemClock:
+    def now(self):
+        return timezone.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def enqueue(self, task, *args, countdown=None):
+        if countdown:
+            return task.apply_async(args=args, countdown=countdown)
+        return task.delay(*args)
+
+    def retry(self, task, countdown, exc=None):
+        raise task.retry(exc=exc, countdown=countdown)
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    return _clock
+
+
+@contextlib.contextmanager
+def use_clock(clock):
+    """Temporarily route now()/sleep()/enqueue()/retry() through `clock`."""
+    global _clock
+    previous = _clock
+    _clock = clock
+    try:
+        yield clock
+    finally:
+        _clock = previous
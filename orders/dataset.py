@@ -0,0 +1,355 @@
+"""
+Synthetic dataset generator for scale testing.
+
+Writes products, locations, per-location inventory and orders with their
+items, lifecycle history, allocations and backorder entries directly to the
+database, bypassing the API and the Celery pipeline, so tens of millions of
+rows can be produced in minutes. Use `python manage.py generate_dataset`.
+
+The data follows the invariants the application relies on: every order has
+the history the tasks would have written for its status (starting with the
+"Order created." row), the denormalised totals of its items, an
+`expected_next_task_eta` while it is in flight, `Allocation` rows once it has
+reached PACKAGING (unless it was canceled afterwards) and `Backorder` rows
+while it is BACKORDERED. A configurable share of the in-flight orders is
+stale, i.e. past its ETA, for exercising the stale sweeper.
+
+Faker is only used to fill small pools of names up front; the per-order work
+samples from those pools with a seeded `random.Random`, so the same seed,
+prefix and `end` produce the same dataset (for the same Faker version). Rows are written
+in chunks of orders, one transaction per chunk, with COPY on PostgreSQL
+(psycopg 3) or `bulk_create` elsewhere.
+"""
+import datetime
+import itertools
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+
+from products.models import Inventory, Location, Product
+
+from .models import Allocation, Backorder, Order, OrderHistory, OrderItem
+
+S = Order.OrderStatus
+
+DEFAULT_STATUS_MIX = {
+    S.DELIVERED: 70, S.SHIPPED: 8, S.PACKAGING: 2, S.PROCESSING: 1, S.PENDING: 1,
+    S.CANCELED: 8, S.FAILED: 5, S.BACKORDERED: 5,
+}
+
+TIME_DISTRIBUTIONS = ('uniform', 'growth', 'diurnal')
+
+# Relative order volume per hour of the day for the diurnal distribution (evening peak)
+DIURNAL_WEIGHTS = [2, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 11, 12, 11, 10, 10, 11, 12, 14, 15, 14, 11, 7, 4]
+
+# Status each final status is reached from, after PENDING -> PROCESSING; CANCELED picks its own point
+_PATHS = {
+    S.PENDING: [S.PENDING],
+    S.PROCESSING: [S.PENDING, S.PROCESSING],
+    S.PACKAGING: [S.PENDING, S.PROCESSING, S.PACKAGING],
+    S.SHIPPED: [S.PENDING, S.PROCESSING, S.PACKAGING, S.SHIPPED],
+    S.DELIVERED: [S.PENDING, S.PROCESSING, S.PACKAGING, S.SHIPPED, S.DELIVERED],
+    S.FAILED: [S.PENDING, S.PROCESSING, S.FAILED],
+    S.BACKORDERED: [S.PENDING, S.PROCESSING, S.BACKORDERED],
+}
+
+# History notes as written by the serializer and the lifecycle tasks
+_NOTES = {
+    S.PENDING: "Order created.",
+    S.PROCESSING: "Order validation started.",
+    S.PACKAGING: "Inventory allocated, order is being packaged.",
+    S.SHIPPED: "Order has been shipped.",
+    S.DELIVERED: "Order has been delivered.",
+    S.FAILED: "Insufficient stock for items.",
+    S.BACKORDERED: "Backordered, waiting for stock.",
+    S.CANCELED: "Order canceled.",
+}
+
+
+def parse_status_mix(value):
+    """Parse 'delivered=70,canceled=8,...' into {status: weight}. Raises ValueError on bad input."""
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        status = name.strip().upper()
+        if status not in S.values:
+            raise ValueError(f"Unknown status {name.strip()!r} (choose from {', '.join(S.values)}).")
+        mix[S(status)] = float(weight)
+    if not mix or any(weight < 0 for weight in mix.values()) or not sum(mix.values()):
+        raise ValueError("The status mix needs at least one positive weight and no negative ones.")
+    return mix
+
+
+class _BulkCreateWriter:
+    method = 'bulk_create'
+
+    def write(self, model, fields, rows):
+        attnames = [model._meta.get_field(name).attname for name in fields]
+        model.objects.bulk_create([model(**dict(zip(attnames, row))) for row in rows])
+
+
+class _CopyWriter:
+    method = 'copy'
+
+    def write(self, model, fields, rows):
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+        with connection.cursor() as cursor:
+            with cursor.copy(f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+
+def get_writer(method='auto'):
+    """'copy' (PostgreSQL with psycopg 3), 'bulk_create', or 'auto' for the fastest available."""
+    can_copy = connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg'
+    if method == 'auto':
+        method = 'copy' if can_copy else 'bulk_create'
+    if method == 'copy':
+        if not can_copy:
+            raise ValueError("COPY needs PostgreSQL with psycopg 3; use bulk_create.")
+        return _CopyWriter()
+    if method == 'bulk_create':
+        return _BulkCreateWriter()
+    raise ValueError(f"Unknown write method {method!r}.")
+
+
+@contextmanager
+def _explicit_timestamps():
+    # bulk_create would overwrite auto_now / auto_now_add values with the current time
+    fields = [
+        field for model in (Order, OrderHistory, Allocation, Backorder, Inventory)
+        for field in model._meta.concrete_fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class DatasetGenerator:
+    """
+    Generates `orders` orders over the `days` before `end`, drawing statuses from
+    `status_mix` ({status: weight}) and creation times from `time_distribution`.
+    Product popularity follows a Zipf-like curve with exponent `skew` (0 = uniform).
+    """
+
+    def __init__(self, orders=100_000, products=1_000, locations=3, days=90, end=None,
+                 status_mix=None, time_distribution='uniform', stale_ratio=0.05,
+                 max_items=4, max_quantity=5, skew=1.0, initial_stock=1_000,
+                 prefix='GEN', chunk_size=10_000, method='auto', seed=0, locale='en_US'):
+        if time_distribution not in TIME_DISTRIBUTIONS:
+            raise ValueError(f"Unknown time distribution {time_distribution!r} (choose from {', '.join(TIME_DISTRIBUTIONS)}).")
+        if days <= 0:
+            raise ValueError("days must be positive.")
+        self.orders = orders
+        self.products = products
+        self.locations = locations
+        self.end = end or timezone.now()
+        self.start = self.end - datetime.timedelta(days=days)
+        self.days = days
+        self.status_mix = status_mix or DEFAULT_STATUS_MIX
+        self.time_distribution = time_distribution
+        self.stale_ratio = stale_ratio
+        self.max_items = max_items
+        self.max_quantity = max_quantity
+        self.skew = skew
+        self.initial_stock = initial_stock
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self.writer = get_writer(method)
+        self.random = random.Random(f"{prefix}:{seed}") # Order ids derive from it, so a new prefix can share a database
+        self.faker = Faker(locale)
+        self.faker.seed_instance(seed)
+        self.counts = dict.fromkeys(('products', 'locations', 'inventory', 'orders', 'items', 'history', 'allocations', 'backorders'), 0)
+
+        # Delays between lifecycle steps, in seconds, from the ranges the tasks sleep for
+        self._delays = {
+            S.PROCESSING: (0.1, 2.0),
+            S.PACKAGING: (settings.ORDER_PROCESSING_DELAY_MIN, settings.ORDER_PROCESSING_DELAY_MAX),
+            S.SHIPPED: (settings.ORDER_SHIPPING_DELAY_MIN, settings.ORDER_SHIPPING_DELAY_MAX),
+            S.DELIVERED: (settings.ORDER_DELIVERY_DELAY_MIN, settings.ORDER_DELIVERY_DELAY_MAX),
+            S.FAILED: (settings.ORDER_PROCESSING_DELAY_MIN, settings.ORDER_PROCESSING_DELAY_MAX),
+            S.BACKORDERED: (settings.ORDER_PROCESSING_DELAY_MIN, settings.ORDER_PROCESSING_DELAY_MAX),
+            S.CANCELED: (60, 6 * 3600), # Canceled by a person, minutes to hours later
+        }
+        # ETA each in-flight status gets, as set by the serializer and the tasks
+        self._eta_seconds = {
+            S.PENDING: 30,
+            S.PROCESSING: int(settings.ORDER_PROCESSING_DELAY_MAX * 1.5),
+            S.PACKAGING: int(settings.ORDER_SHIPPING_DELAY_MAX * 1.5),
+            S.SHIPPED: int(settings.ORDER_DELIVERY_DELAY_MAX * 1.5),
+        }
+
+    def run(self, progress=None):
+        """Write the dataset and return a report. `progress(report)` is called after each chunk."""
+        if Product.objects.filter(sku__startswith=f"{self.prefix}-").exists():
+            raise ValueError(f"Products with the SKU prefix {self.prefix!r} already exist; choose another prefix.")
+        started = time.perf_counter()
+        with _explicit_timestamps():
+            with transaction.atomic():
+                self._write_catalogue()
+            self._prepare_sampling()
+            written = 0
+            while written < self.orders:
+                size = min(self.chunk_size, self.orders - written)
+                with transaction.atomic():
+                    self._write_orders(size)
+                written += size
+                if progress:
+                    progress(self._report(started))
+        if settings.STALE_DEADLINE_INDEX_URL:
+            from .deadlines import rebuild_deadline_index
+
+            rebuild_deadline_index() # The stale sweeper only sees orders that are in the shared index
+        return self._report(started)
+
+    def _report(self, started):
+        elapsed = time.perf_counter() - started
+        rows = sum(self.counts.values())
+        return {
+            'method': self.writer.method,
+            'counts': dict(self.counts),
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed) if elapsed else None,
+        }
+
+    def _write(self, model, fields, rows, counter):
+        if rows:
+            self.writer.write(model, fields, rows)
+            self.counts[counter] += len(rows)
+
+    def _write_catalogue(self):
+        fake, rng, now = self.faker, self.random, self.end
+        self._write(Location, ['code', 'name', 'priority', 'is_active'], [
+            (f"{self.prefix}-L{j}", f"{fake.city()} fulfilment centre", (j + 1) * 10, True)
+            for j in range(self.locations)
+        ], 'locations')
+
+        names = [fake.catch_phrase() for _ in range(min(self.products, 5_000))]
+        descriptions = [fake.sentence(nb_words=12) for _ in range(min(self.products, 1_000))]
+        products = []
+        for i in range(self.products):
+            price = min(max(rng.lognormvariate(3.5, 0.9), 0.5), 99_999)
+            products.append((names[i % len(names)], f"{self.prefix}-{i:07d}", rng.choice(descriptions), Decimal(f"{price:.2f}")))
+        self._write(Product, ['name', 'sku', 'description', 'price'], products, 'products')
+
+        self._product_ids = [pk for _, pk in sorted(
+            Product.objects.filter(sku__startswith=f"{self.prefix}-").values_list('sku', 'pk')
+        )]
+        self._prices = [row[3] for row in products]
+        location_ids = [pk for _, pk in sorted(
+            Location.objects.filter(code__startswith=f"{self.prefix}-L").values_list('code', 'pk'),
+            key=lambda row: int(row[0].rsplit('L', 1)[1]),
+        )]
+        self._write(Inventory, ['product', 'location', 'stock_level', 'last_updated'], [
+            (product_id, location_id, rng.randint(0, self.initial_stock), now)
+            for product_id in self._product_ids for location_id in location_ids
+        ], 'inventory')
+        inventory = dict(
+            ((product_id, location_id), pk) for product_id, location_id, pk in
+            Inventory.objects.filter(location_id__in=location_ids).values_list('product_id', 'location_id', 'pk')
+        )
+        self._inventory_ids = [[inventory[product_id, location_id] for location_id in location_ids] for product_id in self._product_ids]
+
+    def _prepare_sampling(self):
+        fake = self.faker
+        self._customers = [fake.name() for _ in range(min(self.orders, 10_000))]
+        self._product_cum_weights = list(itertools.accumulate(1 / (rank ** self.skew) for rank in range(1, self.products + 1)))
+        self._statuses = list(self.status_mix)
+        self._status_cum_weights = list(itertools.accumulate(self.status_mix.values()))
+        self._hour_cum_weights = list(itertools.accumulate(DIURNAL_WEIGHTS))
+        # Diurnal hours are hours of the calendar day (TIME_ZONE), counted from midnight before `start`
+        self._first_midnight = timezone.localtime(self.start).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._calendar_days = (timezone.localtime(self.end).date() - self._first_midnight.date()).days + 1
+
+    def _created_at(self):
+        rng, span = self.random, (self.end - self.start).total_seconds()
+        if self.time_distribution == 'growth':
+            offset = span * rng.random() ** 0.5 # Volume grows linearly towards `end`
+        elif self.time_distribution == 'diurnal':
+            while True: # Redraw times outside [start, end] (the partial first and last days)
+                hour = rng.choices(range(24), cum_weights=self._hour_cum_weights)[0]
+                created = self._first_midnight + datetime.timedelta(days=rng.randrange(self._calendar_days), hours=hour + rng.random())
+                if self.start <= created <= self.end:
+                    return created
+        else:
+            offset = span * rng.random()
+        return self.start + datetime.timedelta(seconds=offset)
+
+    def _path(self, status):
+        if status != S.CANCELED:
+            return _PATHS[status]
+        return [S.PENDING, S.PROCESSING, S.PACKAGING][:self.random.randint(1, 3)] + [S.CANCELED]
+
+    def _write_orders(self, size):
+        rng, end = self.random, self.end
+        orders, items, history, allocations, backorders = [], [], [], [], []
+        statuses = rng.choices(self._statuses, cum_weights=self._status_cum_weights, k=size)
+        product_count, location_count = len(self._product_ids), len(self._inventory_ids[0]) if self._inventory_ids else 0
+
+        for status in statuses:
+            order_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            path = self._path(status)
+
+            # Transition times from creation onwards, then shifted into place
+            times = [self._created_at()]
+            for step in path[1:]:
+                low, high = self._delays[step]
+                times.append(times[-1] + datetime.timedelta(seconds=rng.uniform(low, high)))
+            eta = None
+            if status in Order.IN_FLIGHT_STATUSES:
+                eta_seconds = self._eta_seconds[status]
+                if rng.random() >= self.stale_ratio:
+                    # Live in-flight orders are recent: their next task is still due
+                    last = end - datetime.timedelta(seconds=rng.uniform(0, eta_seconds))
+                else:
+                    last = min(times[-1], end - datetime.timedelta(seconds=eta_seconds + rng.uniform(1, 3600)))
+                shift = last - times[-1]
+                times = [moment + shift for moment in times]
+                eta = times[-1] + datetime.timedelta(seconds=eta_seconds)
+            elif times[-1] > end:
+                shift = end - times[-1]
+                times = [moment + shift for moment in times]
+
+            lines = set(rng.choices(range(product_count), cum_weights=self._product_cum_weights, k=rng.randint(1, self.max_items)))
+            total_amount, total_units = Decimal('0.00'), 0
+            for index in lines:
+                quantity = min(self.max_quantity, 1 + int(rng.expovariate(1.0)))
+                price = self._prices[index]
+                items.append((order_id, self._product_ids[index], quantity, price))
+                total_amount += quantity * price
+                total_units += quantity
+                if S.PACKAGING in path and status != S.CANCELED and location_count:
+                    allocations.append((order_id, self._inventory_ids[index][rng.randrange(location_count)], quantity, times[2]))
+            if status == S.BACKORDERED:
+                for index in rng.sample(sorted(lines), rng.randint(1, len(lines))):
+                    backorders.append((order_id, self._product_ids[index], times[-1]))
+
+            orders.append((order_id, rng.choice(self._customers), times[0], times[-1], status, eta,
+                           total_amount, len(lines), total_units))
+            previous = S.PENDING
+            for step, moment in zip(path, times):
+                history.append((order_id, previous, step, moment, _NOTES[step]))
+                previous = step
+
+        self._write(Order, ['id', 'customer_name', 'created_at', 'updated_at', 'status', 'expected_next_task_eta',
+                            'total_amount', 'item_count', 'total_units'], orders, 'orders')
+        self._write(OrderItem, ['order', 'product', 'quantity', 'price_at_purchase'], items, 'items')
+        self._write(OrderHistory, ['order', 'from_status', 'to_status', 'timestamp', 'notes'], history, 'history')
+        self._write(Allocation, ['order', 'inventory', 'quantity', 'created_at'], allocations, 'allocations')
+        self._write(Backorder, ['order', 'product', 'created_at'], backorders, 'backorders')
@@ -0,0 +1,224 @@
+"""
+Deadline index for stale order detection.
+
+Every in-flight order with an `expected_next_task_eta` has one entry here,
+scored by that ETA. `update_order_status` (and `postpone_expected_eta`) keep
+it in sync on commit, so the stale sweeper only has to pop the entries that
+are due instead of scanning the orders table.
+
+The index is a Redis sorted set, shared by web and worker processes, and only
+exists when STALE_DEADLINE_INDEX_URL is set. Without it nothing is mirrored and
+`expire_due_orders` reads the due orders from the partial ETA index in the
+database instead: a per-process index would never see ETAs set in other
+processes. The index is never the source of truth: due entries are re-checked
+against the database before an order is failed.
+"""
+import datetime
+import heapq
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryDeadlineIndex:
+    """
+    Min-heap keyed by ETA with lazy deletion; `_deadlines` holds the live score per order.
+    A process-local stand-in for the Redis index (tests, single-process tools); production
+    paths never use it, as its entries are only dropped when they are popped.
+    """
+
+    needs_rebuild = True  # Starts empty in every process
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._lock = threading.Lock()
+
+    def add(self, order_id, eta):
+        order_id = str(order_id)
+        with self._lock:
+            self._deadlines[order_id] = eta
+            heapq.heappush(self._heap, (eta, order_id))
+
+    def add_many(self, entries):
+        with self._lock:
+            for order_id, eta in entries:
+                order_id = str(order_id)
+                self._deadlines[order_id] = eta
+                heapq.heappush(self._heap, (eta, order_id))
+
+    def replace(self, entries):
+        heap = [(eta, str(order_id)) for order_id, eta in entries]
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._deadlines = {order_id: eta for eta, order_id in heap}
+
+    def discard(self, *order_ids):
+        with self._lock:
+            for order_id in order_ids:
+                self._deadlines.pop(str(order_id), None)
+
+    def pop_due(self, now, limit):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                eta, order_id = heapq.heappop(self._heap)
+                if self._deadlines.get(order_id) == eta:  # Skip superseded / discarded entries
+                    del self._deadlines[order_id]
+                    due.append(order_id)
+        return due
+
+    def next_deadline(self):
+        with self._lock:
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+
+class RedisDeadlineIndex:
+    """Sorted set: member = order id, score = ETA as a Unix timestamp."""
+
+    needs_rebuild = False  # Shared and persistent; rebuilt with `manage.py reconcile_deadline_index`
+
+    def __init__(self, url, key='orders:stale_deadlines'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def add(self, order_id, eta):
+        self.client.zadd(self.key, {str(order_id): eta})
+
+    def add_many(self, entries):
+        mapping = {str(order_id): eta for order_id, eta in entries}
+        if mapping:
+            self.client.zadd(self.key, mapping)
+
+    def replace(self, entries, chunk_size=5000):
+        # Build under a scratch key and swap it in, so sweepers never see a half-built index
+        scratch = f"{self.key}:rebuild"
+        self.client.delete(scratch)
+        batch = {}
+        for order_id, eta in entries:
+            batch[str(order_id)] = eta
+            if len(batch) >= chunk_size:
+                self.client.zadd(scratch, batch)
+                batch = {}
+        if batch:
+            self.client.zadd(scratch, batch)
+        if self.client.exists(scratch):
+            self.client.rename(scratch, self.key)
+        else:
+            self.client.delete(self.key)
+
+    def discard(self, *order_ids):
+        if order_ids:
+            self.client.zrem(self.key, *map(str, order_ids))
+
+    def pop_due(self, now, limit):
+        candidates = self.client.zrangebyscore(self.key, '-inf', now, start=0, num=limit)
+        if not candidates:
+            return []
+        # ZREM returns 1 only for the caller that actually removed the member, so
+        # concurrent sweepers never claim the same order twice
+        pipe = self.client.pipeline(transaction=False)
+        for member in candidates:
+            pipe.zrem(self.key, member)
+        claimed = pipe.execute()
+        return [member.decode() for member, removed in zip(candidates, claimed) if removed]
+
+    def next_deadline(self):
+        head = self.client.zrange(self.key, 0, 0, withscores=True)
+        return head[0][1] if head else None
+
+    def __len__(self):
+        return self.client.zcard(self.key)
+
+
+_index = None
+
+# Rows saved in transactions that were still open when the rebuild read its snapshot may carry
+# an updated_at just before the rebuild started, so the catch-up looks back this far.
+REBUILD_OVERLAP = datetime.timedelta(minutes=1)
+
+
+def get_deadline_index():
+    """The shared index, or None when STALE_DEADLINE_INDEX_URL is not set."""
+    global _index
+    if not settings.STALE_DEADLINE_INDEX_URL:
+        return None
+    if _index is None:
+        _index = RedisDeadlineIndex(settings.STALE_DEADLINE_INDEX_URL)
+    return _index
+
+
+def sync_deadline(order_id, eta):
+    """
+    Mirror an order's expected_next_task_eta (a datetime or None) into the index once the
+    surrounding transaction commits. Index failures are reported but never break the caller;
+    the reconcile repairs any drift. A no-op without a shared index.
+    """
+    if not settings.STALE_DEADLINE_INDEX_URL:
+        return
+
+    def apply():
+        try:
+            if eta is None:
+                get_deadline_index().discard(order_id)
+            else:
+                get_deadline_index().add(order_id, eta.timestamp())
+        except Exception:
+            logger.warning("Could not update deadline index", exc_info=True, extra={'event': 'deadlines.sync_failed', 'order_id': str(order_id)})
+
+    transaction.on_commit(apply)
+
+
+def sync_deadlines(order_ids, eta):
+    """sync_deadline for many orders sharing one ETA (bulk status changes): one index call on commit."""
+    order_ids = list(order_ids)
+
+    def apply():
+        try:
+            if eta is None:
+                get_deadline_index().discard(*order_ids)
+            else:
+                get_deadline_index().add_many((order_id, eta.timestamp()) for order_id in order_ids)
+        except Exception:
+            logger.warning("Could not update deadline index", exc_info=True, extra={'event': 'deadlines.sync_failed', 'count': len(order_ids)})
+
+    if order_ids and settings.STALE_DEADLINE_INDEX_URL:
+        transaction.on_commit(apply)
+
+
+def rebuild_deadline_index(chunk_size=5000, index=None):
+    """
+    Replace the index contents with every in-flight order's ETA from the database.
+    Returns the index size, or None when there is no shared index to rebuild.
+    """
+    from .models import Order
+
+    index = index or get_deadline_index()
+    if index is None:
+        return None
+    in_flight = Order.objects.in_flight().filter(expected_next_task_eta__isnull=False)
+    started = timezone.now() - REBUILD_OVERLAP
+    rows = in_flight.values_list('id', 'expected_next_task_eta').iterator(chunk_size=chunk_size)
+    index.replace((order_id, eta.timestamp()) for order_id, eta in rows)
+    # replace() overwrote whatever sync_deadline added while the snapshot was being read;
+    # put back the ETAs that changed since. Entries for orders that left flight meanwhile
+    # are harmless: they are re-checked and dropped when they come due.
+    index.add_many(
+        (order_id, eta.timestamp())
+        for order_id, eta in in_flight.filter(updated_at__gte=started).values_list('id', 'expected_next_task_eta')
+    )
+    index.needs_rebuild = False
+    return len(index)
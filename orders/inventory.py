@@ -0,0 +1,84 @@
+"""
+Stock helpers shared by allocation (orders/allocation.py, backorders) and cancellation.
+
+Stock lives in one `Inventory` row per product and location. Whoever changes
+several rows in one transaction locks them in primary key order, so
+concurrent allocators and cancellations can't deadlock. When order rows are
+locked too, they are locked first. Locks are taken `FOR UPDATE OF` the
+inventory rows only: the joined location row is shared by every product.
+"""
+from collections import Counter
+
+from django.db.models import Case, F, When
+
+from products.models import Inventory
+
+
+class StockRow:
+    """In-memory view of one inventory row that allocation strategies plan against."""
+    __slots__ = ('inventory_id', 'product_id', 'location_id', 'priority', 'available')
+
+    def __init__(self, inventory_id, product_id, location_id, priority, available):
+        self.inventory_id = inventory_id
+        self.product_id = product_id
+        self.location_id = location_id
+        self.priority = priority
+        self.available = available
+
+    def __repr__(self):
+        return f"StockRow(inventory={self.inventory_id}, product={self.product_id}, location={self.location_id}, available={self.available})"
+
+
+def demand_by_product(items):
+    """Units needed per product_id for (product_id, quantity) lines; an order may list a product twice."""
+    demand = Counter()
+    for product_id, quantity in items:
+        demand[product_id] += quantity
+    return demand
+
+
+def _stock_rows(queryset):
+    return [
+        StockRow(*values)
+        for values in queryset.values_list('pk', 'product_id', 'location_id', 'location__priority', 'stock_level')
+    ]
+
+
+def load_stock(product_ids, lock=False, exclude=()):
+    """
+    {product_id: [StockRow]} for the products' rows at active locations.
+    With lock=True the rows are locked (in pk order) until the transaction ends.
+    """
+    queryset = Inventory.objects.filter(product_id__in=product_ids, location__is_active=True)
+    if exclude:
+        queryset = queryset.exclude(pk__in=exclude)
+    if lock:
+        queryset = queryset.select_for_update(of=('self',))
+    stock = {}
+    for row in _stock_rows(queryset.order_by('pk')):
+        stock.setdefault(row.product_id, []).append(row)
+    return stock
+
+
+def lock_rows(inventory_ids, skip_locked=False):
+    """
+    Lock the given inventory rows in pk order; {inventory_id: StockRow}. With skip_locked,
+    rows another transaction holds are left out instead of waited for.
+    """
+    queryset = Inventory.objects.filter(pk__in=inventory_ids).select_for_update(of=('self',), skip_locked=skip_locked)
+    return {row.inventory_id: row for row in _stock_rows(queryset.order_by('pk'))}
+
+
+def adjust_stock(deltas):
+    """
+    Apply {inventory_id: +/- units} in one UPDATE ... CASE statement.
+    Lock the rows first and check that no level goes negative.
+    """
+    deltas = {inventory_id: delta for inventory_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return Inventory.objects.filter(pk__in=deltas).update(stock_level=Case(
+        *[When(pk=inventory_id, then=F('stock_level') + delta) for inventory_id, delta in deltas.items()],
+        default=F('stock_level'),
+        output_field=Inventory._meta.get_field('stock_level'),
+    ))
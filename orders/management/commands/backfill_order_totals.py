@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from orders.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill Order.total_amount / item_count / total_units for orders created before those columns existed. "
+        "Works in primary-key chunks, one short transaction each, and can be re-run safely."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Orders per chunk.")
+        parser.add_argument('--all', action='store_true', help="Recompute every order, not just the ones still NULL.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        orders = Order.objects.all() if options['all'] else Order.objects.filter(total_amount__isnull=True)
+
+        done = 0
+        last_pk = None
+        while True:
+            chunk = orders.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+
+            totals = {
+                row['order_id']: row
+                for row in OrderItem.objects.filter(order_id__in=ids)
+                .values('order_id')
+                .annotate(total_amount=Sum(F('quantity') * F('price_at_purchase')), item_count=Count('id'), total_units=Sum('quantity'))
+            }
+            updates = []
+            for order_id in ids:
+                row = totals.get(order_id, {})
+                updates.append(Order(
+                    pk=order_id,
+                    total_amount=row.get('total_amount') or 0,
+                    item_count=row.get('item_count') or 0,
+                    total_units=row.get('total_units') or 0,
+                ))
+            with transaction.atomic():
+                Order.objects.bulk_update(updates, ['total_amount', 'item_count', 'total_units'])
+
+            done += len(ids)
+            last_pk = ids[-1]
+            self.stdout.write(f"  {done} orders backfilled")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled totals for {done} orders."))
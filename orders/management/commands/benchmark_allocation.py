@@ -0,0 +1,162 @@
+import json
+import queue
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection, transaction
+
+from orders.allocation import ALLOCATION_STRATEGIES, allocate_order, get_allocation_strategy
+from orders.models import Allocation, Order
+from orders.stats import percentile
+from products.models import Inventory, Location, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent stock allocation on popular SKUs: for each location count and strategy, "
+        "worker threads allocate orders in parallel and the throughput and latency are reported. "
+        "Run against PostgreSQL; the benchmark data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--locations', default='1,4', help="Comma-separated location counts to compare (default: 1,4).")
+        parser.add_argument('--strategies', default=','.join(ALLOCATION_STRATEGIES), help="Comma-separated strategies.")
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent allocating connections.")
+        parser.add_argument('--orders', type=int, default=2000, help="Orders allocated per run.")
+        parser.add_argument('--products', type=int, default=1, help="Hot SKUs every order draws from.")
+        parser.add_argument('--quantity', type=int, default=1, help="Units per product per order.")
+        parser.add_argument('--hold-ms', type=float, default=5.0,
+                            help="Work done inside the allocating transaction while its locks are held "
+                                 "(status update, history row, ...).")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if options['threads'] > 1 and connection.vendor != 'postgresql':
+            raise CommandError(f"Concurrent runs need PostgreSQL row locks ({connection.vendor} serialises writers); use --threads 1.")
+        pool = (connection.settings_dict.get('OPTIONS') or {}).get('pool')
+        if isinstance(pool, dict) and options['threads'] > pool.get('max_size', options['threads']):
+            # Threads would queue for (and time out on) pool connections instead of row locks
+            raise CommandError(
+                f"--threads {options['threads']} exceeds DB_POOL_MAX_SIZE {pool['max_size']}; "
+                f"raise DB_POOL_MAX_SIZE or run with DB_POOL=false."
+            )
+        strategies = [name.strip() for name in options['strategies'].split(',') if name.strip()]
+        for name in strategies:
+            try:
+                get_allocation_strategy(name)
+            except ImportError:
+                raise CommandError(f"Unknown strategy {name!r}.")
+        location_counts = [int(count) for count in options['locations'].split(',')]
+
+        results = []
+        for locations in location_counts:
+            for name in strategies:
+                result = self._run(locations, name, options)
+                results.append(result)
+                if not options['json']:
+                    self._print_result(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def _run(self, location_count, strategy_name, options):
+        run_id = uuid.uuid4().hex[:8]
+        order_count = options['orders']
+        # Enough stock that no run ever goes short, spread evenly over the locations
+        per_location = order_count * options['quantity'] // location_count + order_count * options['quantity']
+
+        locations = [
+            Location.objects.create(code=f"BENCH-{run_id}-L{j}", name=f"Benchmark location {j}", priority=j)
+            for j in range(location_count)
+        ]
+        products = [
+            Product.objects.create(name=f"Benchmark product {i}", sku=f"BENCH-{run_id}-{i}", price=1)
+            for i in range(options['products'])
+        ]
+        Inventory.objects.bulk_create(
+            Inventory(product=product, location=location, stock_level=per_location)
+            for product in products for location in locations
+        )
+        orders = Order.objects.bulk_create(
+            Order(customer_name=f"Benchmark {run_id}", status=Order.OrderStatus.PROCESSING) for _ in range(order_count)
+        )
+        demand = {product.pk: options['quantity'] for product in products}
+        strategy = get_allocation_strategy(strategy_name)
+
+        work = queue.Queue()
+        for order in orders:
+            work.put(order)
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker():
+            local_latencies, local_errors = [], []
+            try:
+                while True:
+                    try:
+                        order = work.get_nowait()
+                    except queue.Empty:
+                        break
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            shortages = allocate_order(order, demand, strategy)
+                            time.sleep(options['hold_ms'] / 1000)
+                        if shortages:
+                            local_errors.append('short')
+                    except DatabaseError as exc:  # Deadlocks, lock timeouts
+                        local_errors.append(type(exc).__name__)
+                    local_latencies.append(time.perf_counter() - started)
+            finally:
+                with lock:
+                    latencies.extend(local_latencies)
+                    errors.extend(local_errors)
+                close_old_connections()
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            rows_used = (
+                Allocation.objects.filter(order__in=orders).values('inventory_id').distinct().count()
+            )
+        finally:
+            Allocation.objects.filter(inventory__location__in=locations).delete()
+            Order.objects.filter(pk__in=[order.pk for order in orders]).delete()
+            Inventory.objects.filter(location__in=locations).delete()
+            Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+            Location.objects.filter(pk__in=[location.pk for location in locations]).delete()
+
+        latencies.sort()
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)
+        return {
+            'locations': location_count,
+            'strategy': strategy_name,
+            'threads': options['threads'],
+            'orders': order_count,
+            'hold_ms': options['hold_ms'],
+            'seconds': round(elapsed, 3),
+            'orders_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'latency_ms': {'p50': ms(percentile(latencies, 50)), 'p95': ms(percentile(latencies, 95)),
+                           'p99': ms(percentile(latencies, 99)), 'max': ms(latencies[-1] if latencies else None)},
+            'errors': {reason: errors.count(reason) for reason in set(errors)},
+            'inventory_rows_used': rows_used,
+        }
+
+    def _print_result(self, result):
+        latency = result['latency_ms']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{result['locations']} location(s), {result['strategy']}"))
+        self.stdout.write(
+            f"  {result['orders']} orders on {result['threads']} threads in {result['seconds']}s: "
+            f"{result['orders_per_second']} orders/s"
+        )
+        self.stdout.write(f"  latency ms p50 / p95 / p99 / max: {latency['p50']} / {latency['p95']} / {latency['p99']} / {latency['max']}")
+        self.stdout.write(f"  inventory rows used: {result['inventory_rows_used']}  errors: {result['errors'] or 'none'}")
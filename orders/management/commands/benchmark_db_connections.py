@@ -0,0 +1,133 @@
+import copy
+import json
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from backend_core.db import pool_stats
+from orders.stats import percentile
+
+MODES = {
+    'off': "new connection per unit of work (CONN_MAX_AGE=0, no pool)",
+    'persistent': "one persistent connection per thread (CONN_MAX_AGE)",
+    'pool': "shared psycopg pool (DB_POOL)",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark database connection handling: threads run request-like units of work (borrow a "
+        "connection, run a few queries, release it as Django does at request/task end) with pooling "
+        "off, with persistent connections and with a pool, and report latency and connections opened."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODES), help=f"Comma-separated modes: {', '.join(MODES)}.")
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent workers (like gthread workers or a burst of tasks).")
+        parser.add_argument('--iterations', type=int, default=500, help="Units of work per thread.")
+        parser.add_argument('--queries', type=int, default=3, help="Queries per unit of work.")
+        parser.add_argument('--pool-size', type=int, default=4, help="max_size of the pool in 'pool' mode.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'postgresql':
+            raise CommandError("This benchmark measures PostgreSQL connection setup; point DATABASES at PostgreSQL.")
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown mode(s): {', '.join(sorted(unknown))}.")
+
+        results = [self._run(mode, options) for mode in modes]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self._print_result(result)
+
+    def _settings_for(self, mode, options):
+        settings_dict = copy.deepcopy(connections[DEFAULT_DB_ALIAS].settings_dict)
+        options_dict = dict(settings_dict.get('OPTIONS') or {})
+        options_dict.pop('pool', None)
+        if mode == 'pool':
+            options_dict['pool'] = {'min_size': 1, 'max_size': options['pool_size'], 'timeout': 30}
+            settings_dict['CONN_MAX_AGE'] = 0
+        else:
+            settings_dict['CONN_MAX_AGE'] = 600 if mode == 'persistent' else 0
+        settings_dict['OPTIONS'] = options_dict
+        return settings_dict
+
+    def _run(self, mode, options):
+        wrapper_class = type(connections[DEFAULT_DB_ALIAS])
+        settings_dict = self._settings_for(mode, options)
+        alias = f"benchmark_{mode}"  # Pools are kept per alias
+        latencies, backends = [], set()
+        lock = threading.Lock()
+
+        def worker():
+            conn = wrapper_class(copy.deepcopy(settings_dict), alias=alias)
+            local_latencies, local_backends = [], set()
+            try:
+                for _ in range(options['iterations']):
+                    started = time.perf_counter()
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT pg_backend_pid()")
+                        local_backends.add(cursor.fetchone()[0])
+                        for _ in range(options['queries'] - 1):
+                            cursor.execute("SELECT 1")
+                            cursor.fetchone()
+                    # What request_finished / the Celery fixup do after each request or task
+                    conn.close_if_unusable_or_obsolete()
+                    local_latencies.append(time.perf_counter() - started)
+            finally:
+                conn.close()
+                with lock:
+                    latencies.extend(local_latencies)
+                    backends.update(local_backends)
+
+        stats = None
+        started = time.perf_counter()
+        try:
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            if mode == 'pool':
+                stats = pool_stats(alias)
+        finally:
+            if mode == 'pool':
+                wrapper_class(settings_dict, alias=alias).close_pool()
+
+        latencies.sort()
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        return {
+            'mode': mode,
+            'description': MODES[mode],
+            'threads': options['threads'],
+            'units': len(latencies),
+            'seconds': round(elapsed, 3),
+            'units_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'latency_ms': {'p50': ms(percentile(latencies, 50)), 'p95': ms(percentile(latencies, 95)),
+                           'p99': ms(percentile(latencies, 99)), 'max': ms(latencies[-1] if latencies else None)},
+            'server_sessions': len(backends),  # Distinct backend pids, roughly connections opened
+            'pool': stats,
+        }
+
+    def _print_result(self, result):
+        latency = result['latency_ms']
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{result['mode']}: {result['description']}"))
+        self.stdout.write(
+            f"  {result['units']} units on {result['threads']} threads in {result['seconds']}s: "
+            f"{result['units_per_second']} units/s"
+        )
+        self.stdout.write(f"  latency ms p50 / p95 / p99 / max: {latency['p50']} / {latency['p95']} / {latency['p99']} / {latency['max']}")
+        self.stdout.write(f"  server sessions opened: {result['server_sessions']}")
+        if result['pool']:
+            pool = result['pool']
+            self.stdout.write(
+                f"  pool: size {pool['pool_size']}/{pool['pool_max']}, borrows {pool['requests_num']}, "
+                f"waited {pool['requests_queued']} times, avg wait {pool['requests_avg_wait_ms']}ms, timeouts {pool['requests_errors']}"
+            )
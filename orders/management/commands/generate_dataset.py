@@ -0,0 +1,86 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders.dataset import DEFAULT_STATUS_MIX, TIME_DISTRIBUTIONS, DatasetGenerator, parse_status_mix
+
+DEFAULT_MIX = ','.join(f"{status.lower()}={weight}" for status, weight in DEFAULT_STATUS_MIX.items())
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large synthetic dataset (products, locations, inventory, orders with items, history, "
+        "allocations and backorders) for scale testing. Rows are written with COPY on PostgreSQL or "
+        "bulk_create elsewhere; the same --seed, --prefix and --end give the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=100_000, help="Orders to generate.")
+        parser.add_argument('--products', type=int, default=1_000, help="Products to generate.")
+        parser.add_argument('--locations', type=int, default=3, help="Fulfilment locations holding each product's stock.")
+        parser.add_argument('--days', type=float, default=90, help="Order creation times span this many days before --end.")
+        parser.add_argument('--end', default=None, help="ISO datetime the data ends at (default: now). Fix it for reproducible data.")
+        parser.add_argument('--status-mix', default=DEFAULT_MIX, help=f"Relative weight of each final status (default: {DEFAULT_MIX}).")
+        parser.add_argument('--time-distribution', choices=TIME_DISTRIBUTIONS, default='uniform',
+                            help="uniform, growth (volume rising towards --end) or diurnal (daily peaks).")
+        parser.add_argument('--stale-ratio', type=float, default=0.05, help="Share of in-flight orders already past their ETA.")
+        parser.add_argument('--max-items', type=int, default=4, help="Maximum lines per order.")
+        parser.add_argument('--max-quantity', type=int, default=5, help="Maximum quantity per line.")
+        parser.add_argument('--skew', type=float, default=1.0, help="Zipf exponent of product popularity (0 = uniform).")
+        parser.add_argument('--initial-stock', type=int, default=1_000, help="Maximum stock level per inventory row.")
+        parser.add_argument('--prefix', default='GEN', help="Prefix of generated SKUs and location codes; must be unused.")
+        parser.add_argument('--chunk-size', type=int, default=10_000, help="Orders written per transaction.")
+        parser.add_argument('--method', choices=['auto', 'copy', 'bulk_create'], default='auto', help="How rows are written.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--locale', default='en_US', help="Faker locale for names.")
+        parser.add_argument('--json', action='store_true', help="Print the final report as JSON.")
+
+    def handle(self, *args, **options):
+        end = None
+        if options['end']:
+            try:
+                end = datetime.datetime.fromisoformat(options['end'])
+            except ValueError:
+                raise CommandError(f"Invalid --end {options['end']!r}; use an ISO datetime.")
+            if timezone.is_naive(end):
+                end = timezone.make_aware(end)
+
+        try:
+            generator = DatasetGenerator(
+                orders=options['orders'],
+                products=options['products'],
+                locations=options['locations'],
+                days=options['days'],
+                end=end,
+                status_mix=parse_status_mix(options['status_mix']),
+                time_distribution=options['time_distribution'],
+                stale_ratio=options['stale_ratio'],
+                max_items=options['max_items'],
+                max_quantity=options['max_quantity'],
+                skew=options['skew'],
+                initial_stock=options['initial_stock'],
+                prefix=options['prefix'],
+                chunk_size=options['chunk_size'],
+                method=options['method'],
+                seed=options['seed'],
+                locale=options['locale'],
+            )
+            report = generator.run(progress=self._progress if options['verbosity'] > 0 and not options['json'] else None)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s, {report['method']})."
+        ))
+        for table, count in report['counts'].items():
+            self.stdout.write(f"  {table}: {count}")
+
+    def _progress(self, report):
+        self.stdout.write(
+            f"  {report['counts']['orders']} orders, {report['rows']} rows, {report['rows_per_second']} rows/s"
+        )
@@ -0,0 +1,133 @@
+import io
+import json
+import pstats
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend_core.profiling import clear_config, get_config, set_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch on-demand profiling of endpoints/tasks on or off at runtime, or summarise the collected "
+        "profiles (hottest frames and queries per endpoint/task)."
+    )
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        enable = subparsers.add_parser('enable', help="Start profiling sampled calls.")
+        enable.add_argument('--rate', type=float, default=None, help="Fraction of matching calls to profile (default: 1 with --target, else 0.01).")
+        enable.add_argument('--target', action='append', default=[], help="URL name (e.g. 'order-list', 'GET order-list') or task name. Repeatable.")
+        enable.add_argument('--mode', choices=['sample', 'cprofile'], default=settings.PROFILING_MODE)
+        enable.add_argument('--minutes', type=float, default=15, help="Switch off automatically after this long (0 = never).")
+
+        subparsers.add_parser('disable', help="Stop profiling.")
+        subparsers.add_parser('status', help="Show the active profiling config.")
+
+        summary = subparsers.add_parser('summary', help="Summarise collected profiles.")
+        summary.add_argument('--target', action='append', default=[], help="Only these targets (file name prefix).")
+        summary.add_argument('--top', type=int, default=15, help="Frames / queries to show per target.")
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'enable':
+            rate = options['rate']
+            if rate is None:
+                rate = 1.0 if options['target'] else 0.01
+            if not 0 < rate <= 1:
+                raise CommandError("--rate must be in (0, 1].")
+            duration = int(options['minutes'] * 60) or None
+            config = set_config(rate, options['target'], options['mode'], duration)
+            self.stdout.write(self.style.SUCCESS(f"Profiling enabled: {config}"))
+            self.stdout.write("Takes effect within PROFILING_CONFIG_TTL seconds in processes that share the cache (CACHE_URL).")
+        elif action == 'disable':
+            clear_config()
+            self.stdout.write(self.style.SUCCESS("Profiling disabled."))
+        elif action == 'status':
+            self.stdout.write(str(get_config()))
+        else:
+            self._summary(options['target'], options['top'])
+
+    def _summary(self, targets, top):
+        directory = Path(settings.PROFILING_DIR)
+        if not directory.is_dir():
+            raise CommandError(f"No profiles in {directory}.")
+
+        names = set()
+        for p in directory.iterdir():
+            if p.is_dir(): # cProfile dumps; task names contain dots, so the whole name is the target
+                names.add(p.name)
+            elif p.name.endswith('.calls.jsonl'):
+                names.add(p.name[:-len('.calls.jsonl')])
+            elif p.name.endswith('.folded'):
+                names.add(p.stem)
+        names = sorted(names)
+        if targets:
+            names = [n for n in names if any(n.startswith(t) for t in targets)]
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self._summarise_calls(directory / f"{name}.calls.jsonl", top)
+            self._summarise_folded(directory / f"{name}.folded", top)
+            self._summarise_cprofile(directory / name, top)
+
+    def _summarise_calls(self, path, top):
+        if not path.exists():
+            return
+        durations, query_counts, query_ms = [], [], []
+        queries = defaultdict(lambda: [0, 0.0])
+        with open(path) as f:
+            for line in f:
+                call = json.loads(line)
+                durations.append(call['duration_ms'])
+                query_counts.append(call['query_count'])
+                query_ms.append(call['query_ms'])
+                for sql, count, ms in call['queries']:
+                    queries[sql][0] += count
+                    queries[sql][1] += ms
+        if not durations:
+            return
+        durations.sort()
+        n = len(durations)
+        self.stdout.write(
+            f"  calls: {n}  p50: {durations[n // 2]:.1f}ms  p95: {durations[min(n - 1, int(n * 0.95))]:.1f}ms  "
+            f"avg queries: {sum(query_counts) / n:.1f}  avg SQL time: {sum(query_ms) / n:.1f}ms"
+        )
+        self.stdout.write("  slowest queries (total ms / count):")
+        for sql, (count, ms) in sorted(queries.items(), key=lambda kv: kv[1][1], reverse=True)[:top]:
+            self.stdout.write(f"    {ms:10.1f} / {count:<6} {sql[:140]}")
+
+    def _summarise_folded(self, path, top):
+        if not path.exists():
+            return
+        self_samples, total_samples = Counter(), Counter()
+        samples = 0
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                count = int(count)
+                frames = stack.split(';')
+                samples += count
+                self_samples[frames[-1]] += count
+                for frame in set(frames):
+                    total_samples[frame] += count
+        if not samples:
+            return
+        self.stdout.write(f"  stack samples: {samples}")
+        self.stdout.write("  hottest frames (self % / total %):")
+        for frame, count in self_samples.most_common(top):
+            self.stdout.write(f"    {100 * count / samples:5.1f}% / {100 * total_samples[frame] / samples:5.1f}%  {frame}")
+
+    def _summarise_cprofile(self, path, top):
+        files = sorted(path.glob('*.prof')) if path.is_dir() else []
+        if not files:
+            return
+        self.stdout.write(f"  cProfile dumps: {len(files)}")
+        out = io.StringIO()
+        stats = pstats.Stats(*map(str, files), stream=out)
+        stats.strip_dirs().sort_stats('tottime').print_stats(top)
+        self.stdout.write(out.getvalue())
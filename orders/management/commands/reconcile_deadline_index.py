@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orders.deadlines import get_deadline_index, rebuild_deadline_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stale order deadline index from the orders table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows read per database round trip.")
+
+    def handle(self, *args, **options):
+        index = get_deadline_index()
+        if index is None:
+            self.stdout.write("STALE_DEADLINE_INDEX_URL is not set: expiry reads the database, there is no index to rebuild.")
+            return
+        backend = type(index).__name__
+        size = rebuild_deadline_index(chunk_size=options['chunk_size'], index=index)
+        self.stdout.write(self.style.SUCCESS(f"Deadline index ({backend}) rebuilt with {size} in-flight orders."))
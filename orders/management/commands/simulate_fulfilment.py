@@ -0,0 +1,99 @@
+import json
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.simulation import FulfilmentSimulation
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the fulfilment pipeline against a virtual clock and report throughput, stage latencies, "
+        "failure rates and inventory exhaustion. Changes are rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help="Simulated traffic window in hours.")
+        parser.add_argument('--orders-per-minute', type=float, default=10, help="Mean (Poisson) order arrival rate.")
+        parser.add_argument('--products', type=int, default=20, help="Number of simulated products to create.")
+        parser.add_argument('--initial-stock', type=int, default=1000, help="Starting stock level per product.")
+        parser.add_argument('--locations', type=int, default=1, help="Fulfilment locations to split each product's stock across.")
+        parser.add_argument('--max-items', type=int, default=3, help="Maximum distinct products per order.")
+        parser.add_argument('--max-quantity', type=int, default=5, help="Maximum quantity per order line.")
+        parser.add_argument('--workers', type=int, default=None, help="Celery worker slots to model (default: unbounded).")
+        parser.add_argument('--stale-check-seconds', type=int, default=60, help="Virtual interval of the stale order beat.")
+        parser.add_argument('--sample-seconds', type=int, default=600, help="Virtual interval between inventory samples.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-drain', action='store_true', help="Stop at the end of the window instead of finishing in-flight orders.")
+        parser.add_argument('--keep', action='store_true', help="Commit the simulated data instead of rolling it back.")
+        parser.add_argument('--json', action='store_true', help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        simulation = FulfilmentSimulation(
+            duration_hours=options['hours'],
+            orders_per_minute=options['orders_per_minute'],
+            products=options['products'],
+            initial_stock=options['initial_stock'],
+            locations=options['locations'],
+            max_items_per_order=options['max_items'],
+            max_quantity=options['max_quantity'],
+            workers=options['workers'],
+            stale_check_seconds=options['stale_check_seconds'],
+            sample_seconds=options['sample_seconds'],
+            seed=options['seed'],
+        )
+
+        started = time.perf_counter()
+        # Every simulated order logs its transitions; only let them through at higher verbosity
+        orders_logger = logging.getLogger('orders')
+        previous_level = orders_logger.level
+        if options['verbosity'] <= 1:
+            orders_logger.setLevel(logging.ERROR)
+        try:
+            with transaction.atomic():
+                report = simulation.run(drain=not options['no_drain'])
+                if not options['keep']:
+                    transaction.set_rollback(True)
+        finally:
+            orders_logger.setLevel(previous_level)
+        report['wall_clock_seconds'] = round(time.perf_counter() - started, 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+            return
+        self._print_summary(report)
+
+    def _print_summary(self, report):
+        fmt = lambda v: '-' if v is None else f"{v:.1f}"
+        self.stdout.write(self.style.MIGRATE_HEADING("Simulation parameters"))
+        for key, value in report['parameters'].items():
+            self.stdout.write(f"  {key}: {value}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Outcome"))
+        self.stdout.write(f"  orders created: {report['orders_created']}")
+        for status, count in sorted(report['final_status'].items()):
+            self.stdout.write(f"  {status}: {count}")
+        self.stdout.write(f"  delivered/hour: {fmt(report['throughput']['delivered_per_hour'])}")
+        self.stdout.write(f"  failure rate: {report['failure_rate']:.2%}")
+        for reason, count in sorted(report['failure_reasons'].items()):
+            self.stdout.write(f"    {reason}: {count}")
+        if report['worker_utilisation'] is not None:
+            self.stdout.write(f"  worker utilisation: {report['worker_utilisation']:.1%}")
+        self.stdout.write(f"  task failures: {report['task_failures']}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Latency (virtual seconds)  count / p50 / p90 / p99 / max"))
+        rows = dict(report['stage_latency_seconds'])
+        rows['end to end'] = report['end_to_end_seconds']
+        rows['queue wait'] = report['queue_wait_seconds']
+        for stage, d in rows.items():
+            self.stdout.write(f"  {stage:<28} {d['count']:>8} / {fmt(d['p50'])} / {fmt(d['p90'])} / {fmt(d['p99'])} / {fmt(d['max'])}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Inventory"))
+        for sku, hour in report['stockout_hour'].items():
+            self.stdout.write(f"  {sku} out of stock at hour {hour}")
+        for point in report['inventory_curve']:
+            self.stdout.write(f"  hour {point['hour']:>7}: {point['units_in_stock']} units, {point['skus_out_of_stock']} SKUs out")
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {report['wall_clock_seconds']}s wall clock."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('expected_next_task_eta__isnull', False), ('status__in', ['PENDING', 'PROCESSING', 'PACKAGING', 'SHIPPED'])), fields=['expected_next_task_eta'], name='order_in_flight_eta_idx'),
+        ),
+    ]
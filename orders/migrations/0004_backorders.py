@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_totals'),
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('PACKAGING', 'Packaging'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('BACKORDERED', 'Backordered'), ('CANCELED', 'Canceled'), ('FAILED', 'Failed')], default='PENDING', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='orderhistory',
+            name='from_status',
+            field=models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('PACKAGING', 'Packaging'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('BACKORDERED', 'Backordered'), ('CANCELED', 'Canceled'), ('FAILED', 'Failed')], max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='orderhistory',
+            name='to_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('PACKAGING', 'Packaging'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('BACKORDERED', 'Backordered'), ('CANCELED', 'Canceled'), ('FAILED', 'Failed')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='Backorder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backorders', to='orders.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backorders', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='backorder_queue_idx')],
+                'unique_together': {('order', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:30
+
+from django.db import migrations
+
+
+def backfill_allocations(apps, schema_editor):
+    # Orders allocated before locations existed took their stock from the one
+    # (now MAIN) inventory row of each product; record that so cancelling them releases it
+    Allocation = apps.get_model('orders', 'Allocation')
+    Inventory = apps.get_model('products', 'Inventory')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    inventory_ids = dict(Inventory.objects.filter(location__code='MAIN').values_list('product_id', 'id'))
+    items = OrderItem.objects.filter(order__status='PACKAGING', order__allocations__isnull=True).values_list('order_id', 'product_id', 'quantity')
+    batch = []
+    for order_id, product_id, quantity in items.iterator(chunk_size=5000):
+        if product_id in inventory_ids:
+            batch.append(Allocation(order_id=order_id, inventory_id=inventory_ids[product_id], quantity=quantity))
+        if len(batch) >= 5000:
+            Allocation.objects.bulk_create(batch)
+            batch = []
+    Allocation.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_allocation'),
+        ('products', '0003_default_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_allocations, migrations.RunPython.noop),
+    ]
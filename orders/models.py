@@ -1,7 +1,19 @@
+import logging
 import uuid
 from django.db import models, transaction
 from django.conf import settings
-from products.models import Product
+from products.models import Inventory, Product
+
+logger = logging.getLogger(__name__)
+
+class OrderQuerySet(models.QuerySet):
+    def in_flight(self):
+        """Orders in a transitional state, i.e. still waiting on a lifecycle task."""
+        return self.filter(status__in=Order.IN_FLIGHT_STATUSES)
+
+    def stale(self, now):
+        """In-flight orders whose expected_next_task_eta has passed."""
+        return self.in_flight().filter(expected_next_task_eta__lt=now).exclude(expected_next_task_eta__isnull=True)
 
 class Order(models.Model):
     class OrderStatus(models.TextChoices):
@@ -10,6 +22,7 @@ class Order(models.Model):
         PACKAGING = 'PACKAGING', 'Packaging' # Added for more steps
         SHIPPED = 'SHIPPED', 'Shipped'
         DELIVERED = 'DELIVERED', 'Delivered'
+        BACKORDERED = 'BACKORDERED', 'Backordered' # Waiting for a restock (ORDER_BACKORDERS_ENABLED)
         CANCELED = 'CANCELED', 'Canceled'
         FAILED = 'FAILED', 'Failed' # For issues like stock unavailability or payment failure
 
@@ -24,6 +37,31 @@ class Order(models.Model):
     )
     # For stale order detection, we need to know which task is expected next
     expected_next_task_eta = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Denormalised from the items at creation time (items are never edited afterwards).
+    # NULL means the order predates these columns and hasn't been backfilled yet.
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    item_count = models.PositiveIntegerField(null=True, blank=True) # Number of order lines
+    total_units = models.PositiveIntegerField(null=True, blank=True) # Sum of line quantities
+
+    objects = OrderQuerySet.as_manager()
+
+    # BACKORDERED is deliberately not in flight: it waits on a restock, not a task, so it never goes stale
+    IN_FLIGHT_STATUSES = [OrderStatus.PENDING, OrderStatus.PROCESSING, OrderStatus.PACKAGING, OrderStatus.SHIPPED]
+    # Anything not yet SHIPPED can be canceled; PACKAGING orders hold allocated stock that is released
+    CANCELABLE_STATUSES = [OrderStatus.PENDING, OrderStatus.PROCESSING, OrderStatus.PACKAGING, OrderStatus.BACKORDERED]
+
+    class Meta:
+        indexes = [
+            # Serves the deadline index rebuild and the stale scan: only in-flight rows with an ETA
+            models.Index(
+                fields=['expected_next_task_eta'],
+                name='order_in_flight_eta_idx',
+                condition=models.Q(status__in=['PENDING', 'PROCESSING', 'PACKAGING', 'SHIPPED'], expected_next_task_eta__isnull=False),
+            ),
+            # Sorting / filtering the order list by value and size
+            models.Index(fields=['total_amount'], name='order_total_amount_idx'),
+            models.Index(fields=['item_count'], name='order_item_count_idx'),
+        ]
 
 
     def __str__(self):
@@ -54,23 +92,131 @@ class OrderHistory(models.Model):
     def __str__(self):
         return f"Order {self.order.id}: {self.from_status} -> {self.to_status} at {self.timestamp}"
 
+class Backorder(models.Model):
+    """
+    Queue entry for a BACKORDERED order: one row per product it is short of.
+    Restocking a product serves its entries oldest first (see orders/backorders.py).
+    """
+    order = models.ForeignKey(Order, related_name='backorders', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='backorders', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('order', 'product')
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='backorder_queue_idx'), # FIFO per product
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} waiting for product {self.product_id}"
+
+class Allocation(models.Model):
+    """
+    Units of one order item's product taken from one inventory row (a product at a location).
+    A split shipment has several rows per product. Cancellation puts the units back where they came from.
+    """
+    order = models.ForeignKey(Order, related_name='allocations', on_delete=models.CASCADE)
+    inventory = models.ForeignKey(Inventory, related_name='allocations', on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.quantity} from inventory {self.inventory_id}"
+
+def summarize_order_lines(lines):
+    """
+    Takes (quantity, unit_price) pairs and returns the denormalised Order totals
+    (total_amount, item_count, total_units) as a dict ready for Order(**...).
+    """
+    total_amount, item_count, total_units = 0, 0, 0
+    for quantity, unit_price in lines:
+        total_amount += quantity * unit_price
+        item_count += 1
+        total_units += quantity
+    return {'total_amount': total_amount, 'item_count': item_count, 'total_units': total_units}
+
+def _order_status_changed(order, old_status, new_status, notes):
+    """Signal and log that follow a status change; callers keep the deadline index in sync."""
+    from .signals import order_status_changed
+
+    order_status_changed.send(sender=Order, order=order, from_status=old_status, to_status=new_status, notes=notes)
+    # Successful transitions are high-volume and may be sampled; failures are always logged
+    level = logging.WARNING if new_status == Order.OrderStatus.FAILED else logging.INFO
+    logger.log(level, "Order status changed", extra={
+        'event': 'order.status_changed', 'order_id': str(order.id),
+        'from_status': old_status, 'to_status': new_status, 'notes': notes,
+    })
+
+def _expected_eta(expected_eta_delta_seconds):
+    import datetime
+
+    from .clock import get_clock
+
+    if expected_eta_delta_seconds:
+        return get_clock().now() + datetime.timedelta(seconds=expected_eta_delta_seconds)
+    # Clear ETA if it's a terminal state or next step is immediate
+    return None
+
 # Utility function to log history and update status
 def update_order_status(order: Order, new_status: Order.OrderStatus, notes: str = None, expected_eta_delta_seconds: int = None):
     """
     Updates order status, logs history, and sets expected ETA for the next task if applicable.
     """
-    from django.utils import timezone
-    import datetime
+    from .deadlines import sync_deadline
 
     old_status = order.status
     order.status = new_status
-
-    if expected_eta_delta_seconds:
-        order.expected_next_task_eta = timezone.now() + datetime.timedelta(seconds=expected_eta_delta_seconds)
-    else:
-        # Clear ETA if it's a terminal state or next step is immediate
-        order.expected_next_task_eta = None
+    order.expected_next_task_eta = _expected_eta(expected_eta_delta_seconds)
 
     order.save(update_fields=['status', 'updated_at', 'expected_next_task_eta'])
+    sync_deadline(order.pk, order.expected_next_task_eta)
     OrderHistory.objects.create(order=order, from_status=old_status, to_status=new_status, notes=notes)
-    print(f"Order {order.id} status updated from {old_status} to {new_status}")
\ No newline at end of file
+    _order_status_changed(order, old_status, new_status, notes)
+
+
+def bulk_update_order_status(orders, new_status: Order.OrderStatus, notes: str = None, expected_eta_delta_seconds: int = None):
+    """
+    Set-based counterpart of update_order_status for many orders at once: one UPDATE for the
+    orders and one bulk INSERT for their history rows. `orders` must carry their current status
+    (the history's from_status), so callers should have selected them FOR UPDATE.
+    """
+    from django.utils import timezone
+
+    from .deadlines import sync_deadlines
+
+    orders = list(orders)
+    if not orders:
+        return orders
+    eta = _expected_eta(expected_eta_delta_seconds)
+    Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+        status=new_status, expected_next_task_eta=eta, updated_at=timezone.now(),
+    )
+    OrderHistory.objects.bulk_create(
+        OrderHistory(order=order, from_status=order.status, to_status=new_status, notes=notes) for order in orders
+    )
+    sync_deadlines([order.pk for order in orders], eta)
+    for order in orders:
+        old_status = order.status
+        order.status = new_status
+        order.expected_next_task_eta = eta
+        _order_status_changed(order, old_status, new_status, notes)
+    return orders
+
+
+def postpone_expected_eta(order_id, delta_seconds: int):
+    """
+    Pushes the stale-detection deadline of an in-flight order out to now + delta_seconds,
+    e.g. while its next task waits for a retry. Orders without an ETA are left alone.
+    """
+    from django.utils import timezone
+
+    from .deadlines import sync_deadline
+
+    new_eta = _expected_eta(delta_seconds)
+    # update() bypasses auto_now; set updated_at so status polls with updated_since see the new ETA
+    updated = Order.objects.filter(pk=order_id, expected_next_task_eta__isnull=False).update(
+        expected_next_task_eta=new_eta, updated_at=timezone.now(),
+    )
+    if updated:
+        sync_deadline(order_id, new_eta)
+    return updated
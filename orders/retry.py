@@ -0,0 +1,147 @@
+"""
+Retry policy for the order lifecycle tasks.
+
+Errors are split into transient ones (lost connection, lock timeout,
+serialization failure, deadlock) that are worth retrying with exponential
+backoff plus jitter, and permanent ones that are not. Transient database
+errors also feed a circuit breaker shared by all workers through the Django
+cache; while it is open, tasks defer themselves instead of piling onto an
+unhealthy database.
+"""
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, InterfaceError, OperationalError, connection
+
+from .clock import get_clock
+
+# PostgreSQL SQLSTATE codes that are safe to retry
+TRANSIENT_PGCODES = {
+    '40001',  # serialization_failure
+    '40P01',  # deadlock_detected
+    '55P03',  # lock_not_available (lock_timeout)
+    '57014',  # query_canceled (statement_timeout)
+    '53300',  # too_many_connections
+}
+TRANSIENT_PGCODE_CLASSES = ('08',)  # connection exceptions
+
+
+def is_transient_error(exc):
+    if isinstance(exc, (OperationalError, InterfaceError)):
+        return True
+    if isinstance(exc, DatabaseError):
+        pgcode = _sqlstate(exc.__cause__) or _sqlstate(exc)
+        if pgcode:
+            return pgcode in TRANSIENT_PGCODES or pgcode.startswith(TRANSIENT_PGCODE_CLASSES)
+    return False
+
+
+def _sqlstate(exc):
+    # psycopg 3 names the SQLSTATE `sqlstate`, psycopg2 `pgcode`
+    return getattr(exc, 'sqlstate', None) or getattr(exc, 'pgcode', None)
+
+
+def backoff_delay(retries, base_delay):
+    """Exponential backoff with full jitter, capped at TASK_RETRY_BACKOFF_MAX seconds."""
+    return get_exponential_backoff_interval(
+        factor=base_delay,
+        retries=retries,
+        maximum=settings.TASK_RETRY_BACKOFF_MAX,
+        full_jitter=True,
+    )
+
+
+class CircuitBreaker:
+    """
+    Failure-count circuit breaker whose state lives in the Django cache so all
+    worker processes share it.
+
+    Closed: failures are counted per `window_seconds` bucket. Once a bucket
+    reaches `failure_threshold` the breaker opens for `reset_seconds`. After
+    that a single caller runs `probe`; success closes the breaker, failure
+    re-opens it. The close time is kept so callers can hold back work that
+    would misread the outage (see `closed_within`). Cache errors fail open,
+    i.e. the breaker never blocks work because the cache itself is unavailable.
+    """
+
+    def __init__(self, name, failure_threshold, window_seconds, reset_seconds, probe=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window_seconds = window_seconds
+        self.reset_seconds = reset_seconds
+        self.probe = probe
+
+    def _key(self, suffix):
+        return f"circuit:{self.name}:{suffix}"
+
+    def _now(self):
+        return get_clock().now().timestamp()
+
+    def _trip(self, now):
+        cache.set(self._key('open_until'), now + self.reset_seconds, timeout=None)
+
+    def record_failure(self):
+        now = self._now()
+        key = self._key(f"failures:{int(now // self.window_seconds)}")
+        try:
+            cache.add(key, 0, timeout=self.window_seconds * 2)
+            if cache.incr(key) >= self.failure_threshold:
+                self._trip(now)
+        except Exception:
+            pass
+
+    def retry_after(self):
+        """Seconds until work may resume; 0 when the breaker is closed."""
+        try:
+            open_until = cache.get(self._key('open_until'))
+            if open_until is None:
+                return 0
+
+            now = self._now()
+            if open_until > now:
+                return open_until - now
+
+            # Half-open: let one caller probe, everyone else keeps waiting briefly
+            if not cache.add(self._key('probe'), 1, timeout=self.reset_seconds):
+                return 1
+            try:
+                healthy = self.probe() if self.probe else True
+            except Exception:
+                healthy = False
+            if healthy:
+                cache.set(self._key('closed_at'), now, timeout=None)
+                cache.delete_many([self._key('open_until'), self._key('probe')])
+                return 0
+            self._trip(now)
+            cache.delete(self._key('probe'))
+            return self.reset_seconds
+        except Exception:
+            return 0
+
+    def is_open(self):
+        return self.retry_after() > 0
+
+    def closed_within(self, seconds):
+        """Whether the breaker closed after an outage less than `seconds` ago."""
+        try:
+            closed_at = cache.get(self._key('closed_at'))
+        except Exception:
+            return False
+        return closed_at is not None and self._now() - closed_at < seconds
+
+
+def _database_is_healthy():
+    if not connection.in_atomic_block: # Closing here would break the caller's transaction
+        connection.close_if_unusable_or_obsolete()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+db_breaker = CircuitBreaker(
+    'database',
+    failure_threshold=settings.DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    window_seconds=settings.DB_CIRCUIT_BREAKER_WINDOW_SECONDS,
+    reset_seconds=settings.DB_CIRCUIT_BREAKER_RESET_SECONDS,
+    probe=_database_is_healthy,
+)
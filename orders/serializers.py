@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.db import transaction
-from .models import Order, OrderItem, OrderHistory, Product, update_order_status
+from .clock import get_clock
+from .models import Allocation, Order, OrderItem, OrderHistory, Product, summarize_order_lines, update_order_status
 from products.serializers import ProductSerializer
 from .tasks import process_order_task
 
@@ -18,19 +20,31 @@ class OrderHistorySerializer(serializers.ModelSerializer):
         model = OrderHistory
         fields = ['from_status', 'to_status', 'timestamp', 'notes']
 
+class OrderAllocationSerializer(serializers.ModelSerializer): # Where the units ship from
+    product_id = serializers.IntegerField(source='inventory.product_id', read_only=True)
+    location = serializers.CharField(source='inventory.location.code', read_only=True)
+
+    class Meta:
+        model = Allocation
+        fields = ['product_id', 'location', 'quantity']
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     history = OrderHistorySerializer(many=True, read_only=True)
+    allocations = OrderAllocationSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'customer_name', 'status', 'created_at', 'updated_at', 'items', 'history', 'expected_next_task_eta']
-        read_only_fields = ['id', 'status', 'created_at', 'updated_at', 'history', 'expected_next_task_eta']
+        fields = ['id', 'customer_name', 'status', 'created_at', 'updated_at', 'items', 'history', 'allocations',
+                  'expected_next_task_eta', 'total_amount', 'item_count', 'total_units']
+        read_only_fields = ['id', 'status', 'created_at', 'updated_at', 'history', 'allocations', 'expected_next_task_eta',
+                            'total_amount', 'item_count', 'total_units']
 
     def create(self, validated_data):
         items_data = validated_data.pop('items')
+        totals = summarize_order_lines((item['quantity'], item['product'].price) for item in items_data)
         with transaction.atomic(): # Ensure order and items are created together
-            order = Order.objects.create(**validated_data)
+            order = Order.objects.create(**validated_data, **totals)
             # Log initial PENDING state
             update_order_status(order, Order.OrderStatus.PENDING, "Order created.",
                                 expected_eta_delta_seconds=30) # Initial small ETA for processing start
@@ -44,9 +58,16 @@ class OrderSerializer(serializers.ModelSerializer):
                     price_at_purchase=product.price # Capture current price
                 )
             # Kick off the asynchronous processing
-            process_order_task.delay(order.id)
+            get_clock().enqueue(process_order_task, order.id)
         return order
 
+class OrderListFilterSerializer(serializers.Serializer): # ?min_total=&max_total=&min_items=&max_items= on the list
+    # DecimalField rejects NaN/Infinity and values the column can't hold, so a bad filter is a 400, not a 500
+    min_total = serializers.DecimalField(max_digits=14, decimal_places=2, required=False)
+    max_total = serializers.DecimalField(max_digits=14, decimal_places=2, required=False)
+    min_items = serializers.IntegerField(min_value=0, max_value=2147483647, required=False)
+    max_items = serializers.IntegerField(min_value=0, max_value=2147483647, required=False)
+
 class BulkOrderRequestItemSerializer(serializers.Serializer): # For input of bulk orders
     customer_name = serializers.CharField(max_length=255)
     items = OrderItemSerializer(many=True) # Re-use item serializer structure
@@ -55,4 +76,33 @@ class BulkOrderResponseItemSerializer(serializers.Serializer):
     order_id = serializers.UUIDField(read_only=True)
     customer_name = serializers.CharField(read_only=True)
     status = serializers.CharField(read_only=True) # e.g., "ACCEPTED" or "FAILED_VALIDATION"
-    message = serializers.CharField(read_only=True, required=False)
\ No newline at end of file
+    message = serializers.CharField(read_only=True, required=False)
+
+class OrderStatusBatchRequestSerializer(serializers.Serializer): # Input for the batch status lookup
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=settings.ORDER_STATUS_BATCH_MAX_IDS)
+    updated_since = serializers.DateTimeField(required=False) # Only return orders changed after this
+
+class OrderStatusSerializer(serializers.Serializer): # Slim per-order status, no items or history
+    id = serializers.UUIDField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+    expected_next_task_eta = serializers.DateTimeField(read_only=True, allow_null=True) # None once the order is final
+
+class OrderStatusBatchResponseSerializer(serializers.Serializer):
+    orders = OrderStatusSerializer(many=True, read_only=True)
+    next_updated_since = serializers.DateTimeField(read_only=True) # Pass back as updated_since on the next poll
+
+class OrderCancelRequestSerializer(serializers.Serializer): # Input for single cancellation
+    notes = serializers.CharField(required=False, allow_blank=True, max_length=1000)
+
+class OrderCancelBatchRequestSerializer(OrderCancelRequestSerializer): # Input for bulk cancellation
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=settings.ORDER_CANCEL_MAX_IDS)
+
+class OrderNotCancelableSerializer(serializers.Serializer):
+    id = serializers.UUIDField(read_only=True)
+    status = serializers.CharField(read_only=True) # Status that prevented the cancellation
+
+class OrderCancelBatchResponseSerializer(serializers.Serializer):
+    canceled = serializers.ListField(child=serializers.UUIDField(), read_only=True)
+    not_cancelable = OrderNotCancelableSerializer(many=True, read_only=True) # Already SHIPPED or final
+    not_found = serializers.ListField(child=serializers.UUIDField(), read_only=True)
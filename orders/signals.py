@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by update_order_status() once the new status and its history row are saved.
+# Keyword arguments: order, from_status, to_status, notes
+order_status_changed = Signal()
@@ -0,0 +1,293 @@
+"""
+Discrete-event simulation of the fulfilment pipeline.
+
+The simulation runs the real Celery task functions (`process_order_task`,
+`ship_order_task`, `deliver_order_task`, `detect_and_handle_stale_orders`) and
+the real `update_order_status` transitions, but against a `VirtualClock`:
+`sleep()` advances virtual time instead of blocking, and `enqueue()` puts the
+next task on an in-process event queue instead of the broker. A day of
+traffic therefore costs only the database work, not the wall-clock delays.
+
+Use `python manage.py simulate_fulfilment` to run it.
+"""
+import datetime
+import heapq
+import itertools
+import random
+from collections import defaultdict
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from products.models import Inventory, Location, Product
+
+from .clock import use_clock
+from .models import Order
+from .serializers import OrderSerializer
+from .signals import order_status_changed
+from .stats import percentile
+from .tasks import detect_and_handle_stale_orders
+
+
+class VirtualClock:
+    """
+    Virtual time plus an in-process scheduler.
+
+    Time is kept as float seconds since `start`. Each event runs with its own
+    cursor, so `sleep()` inside a task only moves that task's time forward,
+    like a task occupying a worker. With `workers=None` the worker pool is
+    unbounded; otherwise events wait in the queue until a worker is free.
+    """
+
+    def __init__(self, start=None, workers=None):
+        self.start = start or timezone.now()
+        self.cursor = 0.0
+        self.workers = workers
+        self._events = []
+        self._seq = itertools.count()
+        self._free_workers = [0.0] * workers if workers else None
+        self.events_run = 0
+        self.task_failures = 0
+        self.retries_scheduled = 0
+        self.busy_seconds = 0.0
+        self.queue_waits = []
+
+    # --- clock interface used by orders.clock ---
+    def now(self):
+        return self.start + datetime.timedelta(seconds=self.cursor)
+
+    def sleep(self, seconds):
+        self.cursor += seconds
+
+    def enqueue(self, task, *args, countdown=None):
+        self.schedule(self.cursor + (countdown or 0), self._run_task, task, *args)
+
+    def retry(self, task, countdown, exc=None):
+        self.retries_scheduled += 1
+        self.schedule(self.cursor + countdown, self._run_task, task, *task.request.args, retries=task.request.retries + 1)
+
+    # --- scheduler ---
+    def schedule(self, at, callback, *args, uses_worker=True, **kwargs):
+        heapq.heappush(self._events, (at, next(self._seq), at, callback, args, kwargs, uses_worker))
+
+    def _run_task(self, task, *args, retries=0):
+        result = task.apply(args=args, retries=retries)
+        if result.failed():
+            self.task_failures += 1
+
+    def run_until(self, until):
+        """Run every event scheduled at or before `until` seconds, in virtual-time order."""
+        while self._events and self._events[0][0] <= until:
+            at, seq, queued_at, callback, args, kwargs, uses_worker = heapq.heappop(self._events)
+            if uses_worker and self._free_workers is not None:
+                if self._free_workers[0] > at:
+                    # No idle worker yet: keep the event queued until one frees up, keeping FIFO order
+                    heapq.heappush(self._events, (self._free_workers[0], seq, queued_at, callback, args, kwargs, uses_worker))
+                    continue
+                heapq.heappop(self._free_workers)
+                self.queue_waits.append(at - queued_at)
+
+            self.cursor = at
+            callback(*args, **kwargs)
+            self.events_run += 1
+
+            if uses_worker:
+                self.busy_seconds += self.cursor - at
+                if self._free_workers is not None:
+                    heapq.heappush(self._free_workers, self.cursor)
+        self.cursor = until
+
+    @property
+    def pending_events(self):
+        return len(self._events)
+
+
+def _distribution(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+
+class FulfilmentSimulation:
+    """
+    Drives synthetic order traffic through the task pipeline on virtual time
+    and collects throughput, stage latency, failure and inventory metrics.
+    """
+
+    def __init__(self, duration_hours=24, orders_per_minute=10, products=20, initial_stock=1000,
+                 max_items_per_order=3, max_quantity=5, workers=None, stale_check_seconds=60,
+                 sample_seconds=600, seed=0, locations=1):
+        self.duration = duration_hours * 3600
+        self.arrival_rate = orders_per_minute / 60
+        self.product_count = products
+        self.initial_stock = initial_stock
+        self.location_count = locations
+        self.max_items_per_order = max_items_per_order
+        self.max_quantity = max_quantity
+        self.stale_check_seconds = stale_check_seconds
+        self.sample_seconds = sample_seconds
+        self.seed = seed
+        self.clock = VirtualClock(workers=workers)
+        self.rng = random.Random(seed)
+
+        self.products = []
+        self.orders_created = 0
+        self._creating = False
+        self.order_started = {}
+        self.last_transition = {}
+        self.stage_latencies = defaultdict(list)
+        self.end_to_end = []
+        self.final_status = defaultdict(int)
+        self.failure_reasons = defaultdict(int)
+        self.inventory_curve = []
+        self.stockout_at = {}
+
+    def setup_catalogue(self):
+        self.products = [
+            Product.objects.create(name=f"Simulated product {i}", sku=f"SIM-{self.seed}-{i}", price=self.rng.randint(5, 500))
+            for i in range(self.product_count)
+        ]
+        locations = [
+            Location.objects.create(code=f"SIM-{self.seed}-L{j}", name=f"Simulated location {j}", priority=j)
+            for j in range(self.location_count)
+        ]
+        # Each product's initial stock is split evenly across the locations
+        share, remainder = divmod(self.initial_stock, len(locations))
+        Inventory.objects.bulk_create(
+            Inventory(product=product, location=location, stock_level=share + (1 if j < remainder else 0))
+            for product in self.products for j, location in enumerate(locations)
+        )
+
+    # --- event callbacks ---
+    def _arrival(self):
+        picked = self.rng.sample(self.products, self.rng.randint(1, min(self.max_items_per_order, len(self.products))))
+        serializer = OrderSerializer(data={
+            'customer_name': f"Simulated customer {self.orders_created}",
+            'items': [{'product_id': p.pk, 'quantity': self.rng.randint(1, self.max_quantity)} for p in picked],
+        })
+        serializer.is_valid(raise_exception=True)
+        self._creating = True
+        try:
+            serializer.save()
+        finally:
+            self._creating = False
+        self.orders_created += 1
+
+        next_at = self.clock.cursor + self.rng.expovariate(self.arrival_rate)
+        if next_at < self.duration:
+            self.clock.schedule(next_at, self._arrival, uses_worker=False)
+
+    def _stale_beat(self):
+        self.clock.enqueue(detect_and_handle_stale_orders)
+        self.clock.schedule(self.clock.cursor + self.stale_check_seconds, self._stale_beat, uses_worker=False)
+
+    def _sample_inventory(self):
+        levels = dict(
+            Inventory.objects.filter(product__in=self.products)
+            .values('product__sku').annotate(units=Sum('stock_level')).values_list('product__sku', 'units')
+        )
+        for sku, level in levels.items():
+            if level == 0 and sku not in self.stockout_at:
+                self.stockout_at[sku] = self.clock.cursor
+        self.inventory_curve.append({
+            'hour': round(self.clock.cursor / 3600, 3),
+            'units_in_stock': sum(levels.values()),
+            'skus_out_of_stock': sum(1 for level in levels.values() if level == 0),
+        })
+        next_at = self.clock.cursor + self.sample_seconds
+        if next_at <= self.duration:
+            self.clock.schedule(next_at, self._sample_inventory, uses_worker=False)
+
+    def _on_status_changed(self, sender, order, from_status, to_status, notes=None, **kwargs):
+        t = self.clock.cursor
+        if self._creating:
+            self.order_started[order.pk] = t
+        elif order.pk not in self.order_started:
+            return # Pre-existing order picked up by the stale detector, not part of this run
+        else:
+            self.stage_latencies[f"{from_status}->{to_status}"].append(t - self.last_transition[order.pk])
+        self.last_transition[order.pk] = t
+
+        if to_status == Order.OrderStatus.DELIVERED:
+            self.end_to_end.append(t - self.order_started[order.pk])
+        elif to_status == Order.OrderStatus.FAILED:
+            notes = notes or ''
+            if 'stale' in notes:
+                self.failure_reasons[f"stale in {from_status}"] += 1
+            elif notes.startswith('Insufficient stock'):
+                self.failure_reasons['insufficient stock'] += 1
+            else:
+                self.failure_reasons['error'] += 1
+
+    # --- driver ---
+    def run(self, drain=True):
+        """
+        Run the simulated traffic window. With `drain`, keep the clock going
+        (without new arrivals) until every in-flight order has finished.
+        """
+        random.seed(self.seed)  # task delays use the module-level RNG
+        order_status_changed.connect(self._on_status_changed, sender=Order)
+        try:
+            with use_clock(self.clock):
+                if not self.products:
+                    self.setup_catalogue()
+                if self.arrival_rate > 0:
+                    self.clock.schedule(self.rng.expovariate(self.arrival_rate), self._arrival, uses_worker=False)
+                self.clock.schedule(self.stale_check_seconds, self._stale_beat, uses_worker=False)
+                self.clock.schedule(0, self._sample_inventory, uses_worker=False)
+
+                self.clock.run_until(self.duration)
+                self.simulated_seconds = self.duration
+                if drain:
+                    # Only the stale beat reschedules itself forever; stop once it is the only thing left
+                    while self.clock.pending_events > 1:
+                        self.clock.run_until(self.clock.cursor + 3600)
+                    self.simulated_seconds = self.clock.cursor
+        finally:
+            order_status_changed.disconnect(self._on_status_changed, sender=Order)
+        return self.report()
+
+    def report(self):
+        statuses = Order.objects.filter(pk__in=self.order_started.keys()).values_list('status', flat=True)
+        final_status = defaultdict(int)
+        for value in statuses:
+            final_status[value] += 1
+        failed = final_status.get(Order.OrderStatus.FAILED, 0)
+        hours = self.duration / 3600
+
+        clock = self.clock
+        worker_capacity = (clock.workers or 0) * getattr(self, 'simulated_seconds', self.duration)
+        return {
+            'parameters': {
+                'duration_hours': hours,
+                'orders_per_minute': self.arrival_rate * 60,
+                'products': len(self.products),
+                'initial_stock': self.initial_stock,
+                'locations': self.location_count,
+                'workers': clock.workers,
+                'seed': self.seed,
+            },
+            'orders_created': self.orders_created,
+            'final_status': dict(final_status),
+            'throughput': {
+                'delivered_per_hour': len(self.end_to_end) / hours if hours else None,
+                'created_per_hour': self.orders_created / hours if hours else None,
+            },
+            'failure_rate': failed / self.orders_created if self.orders_created else 0.0,
+            'failure_reasons': dict(self.failure_reasons),
+            'stage_latency_seconds': {stage: _distribution(v) for stage, v in sorted(self.stage_latencies.items())},
+            'end_to_end_seconds': _distribution(self.end_to_end),
+            'queue_wait_seconds': _distribution(clock.queue_waits),
+            'worker_utilisation': clock.busy_seconds / worker_capacity if worker_capacity else None,
+            'task_failures': clock.task_failures,
+            'retries_scheduled': clock.retries_scheduled,
+            'events_run': clock.events_run,
+            'stockout_hour': {sku: round(t / 3600, 3) for sku, t in sorted(self.stockout_at.items(), key=lambda kv: kv[1])},
+            'inventory_curve': self.inventory_curve,
+        }
@@ -0,0 +1,11 @@
+"""
+Small summary statistics shared by the simulator and the benchmark commands.
+"""
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank q-th percentile (0-100) of an already sorted sequence, or None if it is empty."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -1,206 +1,396 @@
 import datetime
+import logging
 import random
 import time
 
 from celery import shared_task
 from django.conf import settings
 from django.db import transaction
-from django.db.models import F
-from django.utils import timezone
 
 from products.models import Inventory  # Import Inventory model
 
-from .models import Order, OrderItem, Product, update_order_status
+from .allocation import allocate_order
+from .backorders import allocate_backorders, backorder_order
+from .clock import get_clock
+from .deadlines import get_deadline_index, rebuild_deadline_index
+from .inventory import demand_by_product
+from .models import Order, OrderItem, Product, postpone_expected_eta, update_order_status
+from .retry import backoff_delay, db_breaker, is_transient_error
+
+logger = logging.getLogger(__name__)
 
 
 def get_simulated_delay(min_delay, max_delay):
     return random.uniform(min_delay, max_delay)
 
+
+def _log_context(task, order_id, **fields):
+    """Structured fields attached to every lifecycle log record via `extra=`."""
+    return {'task': task.name, 'order_id': str(order_id), **fields}
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def defer_while_db_unhealthy(task, order_id):
+    """
+    Re-enqueue the task instead of running it while the database circuit breaker is open.
+    The restart is spread over one reset window so deferred orders don't come back in one wave.
+    """
+    wait = db_breaker.retry_after()
+    if not wait:
+        return False
+    countdown = wait + random.uniform(0, settings.DB_CIRCUIT_BREAKER_RESET_SECONDS)
+    logger.warning("Database circuit open, deferring task", extra=_log_context(task, order_id, event='task.deferred', countdown_s=round(countdown, 1)))
+    get_clock().enqueue(task, order_id, countdown=countdown)
+    return True
+
+
+def stale_detection_paused():
+    """
+    Whether stale detection must wait for the database to recover. Tasks deferred while the breaker
+    was open keep their old ETAs and come back up to a reset window plus jitter after it closes
+    (defer_while_db_unhealthy); failing their orders as stale before then would turn a brownout
+    into mass FAILED orders.
+    """
+    if db_breaker.is_open():
+        logger.warning("Database circuit open, skipping stale order detection", extra={'event': 'stale.skipped'})
+        return True
+    if db_breaker.closed_within(2 * db_breaker.reset_seconds):
+        logger.info("Database recovering, deferred tasks still pending, skipping stale order detection", extra={'event': 'stale.skipped'})
+        return True
+    return False
+
+
+def retry_or_fail(task, order_id, exc, stage, eta_window_seconds):
+    """
+    Retry transient errors with exponential backoff plus jitter; mark the order FAILED
+    only for permanent errors or once retries are exhausted.
+    """
+    notes = f"Unhandled exception in {stage}: {exc}"
+    if is_transient_error(exc):
+        db_breaker.record_failure()
+        if task.request.retries < task.max_retries:
+            countdown = backoff_delay(task.request.retries, task.default_retry_delay)
+            logger.warning("Transient error, retrying", extra=_log_context(
+                task, order_id, event='task.retry', stage=stage, error=repr(exc),
+                retry=task.request.retries + 1, max_retries=task.max_retries, countdown_s=countdown,
+            ))
+            try:
+                # Keep the stale detector from failing the order while it waits for the retry
+                postpone_expected_eta(order_id, countdown + eta_window_seconds)
+            except Exception:
+                pass
+            get_clock().retry(task, countdown, exc=exc)
+            return
+        notes = f"{notes} (gave up after {task.max_retries} retries)"
+
+    logger.error("Task failed, marking order FAILED", exc_info=exc, extra=_log_context(
+        task, order_id, event='task.failed', stage=stage, error=repr(exc), retries=task.request.retries,
+    ))
+    try:
+        # Never overwrite a terminal status, e.g. an order canceled while the task was retrying
+        order = Order.objects.in_flight().get(id=order_id)
+        update_order_status(order, Order.OrderStatus.FAILED, notes=notes)
+    except Exception:
+        pass # Order not found, no longer in flight or database still unavailable, nothing to update
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60) # Added retry mechanism
 def process_order_task(self, order_id):
+    if defer_while_db_unhealthy(self, order_id):
+        return
+    started = time.perf_counter()
     try:
         order = Order.objects.get(id=order_id)
-        if order.status != Order.OrderStatus.PENDING:
-            print(f"Order {order_id} is not PENDING, skipping process_order_task. Current status: {order.status}")
+        # A retry may find the order already PROCESSING; allocation and the move to PACKAGING
+        # commit together, so PROCESSING means nothing has been allocated yet
+        resumable = [Order.OrderStatus.PENDING, Order.OrderStatus.PROCESSING] if self.request.retries else [Order.OrderStatus.PENDING]
+        if order.status not in resumable:
+            logger.info("Order is not PENDING, skipping", extra=_log_context(self, order_id, event='task.skipped', status=order.status))
             return
 
-        print(f"Task: Processing order {order_id}")
-        # Simulate initial processing / payment validation
-        time.sleep(get_simulated_delay(settings.ORDER_PROCESSING_DELAY_MIN / 2, settings.ORDER_PROCESSING_DELAY_MAX / 2))
+        logger.debug("Processing order", extra=_log_context(self, order_id, event='task.started', retry=self.request.retries))
+        if order.status == Order.OrderStatus.PENDING:
+            # Simulate initial processing / payment validation
+            get_clock().sleep(get_simulated_delay(settings.ORDER_PROCESSING_DELAY_MIN / 2, settings.ORDER_PROCESSING_DELAY_MAX / 2))
 
-        update_order_status(
-            order,
-            Order.OrderStatus.PROCESSING,
-            notes="Order validation started.",
-            expected_eta_delta_seconds=int(settings.ORDER_PROCESSING_DELAY_MAX * 1.5) # Time for inventory check + packaging
-        )
+            with transaction.atomic():
+                # The order may have been canceled while we were validating
+                order = Order.objects.select_for_update().get(id=order_id)
+                if order.status != Order.OrderStatus.PENDING:
+                    logger.info("Order is no longer PENDING, skipping", extra=_log_context(self, order_id, event='task.skipped', status=order.status))
+                    return
+                update_order_status(
+                    order,
+                    Order.OrderStatus.PROCESSING,
+                    notes="Order validation started.",
+                    expected_eta_delta_seconds=int(settings.ORDER_PROCESSING_DELAY_MAX * 1.5) # Time for inventory check + packaging
+                )
 
         # --- Inventory Check and Allocation ---
         try:
             with transaction.atomic():
-                order_items_to_check = order.items.select_related('product').all()
-                unavailable_items = []
-
-                for item in order_items_to_check:
-                    # Lock the inventory row for this product to prevent race conditions
-                    inventory = Inventory.objects.select_for_update().get(product=item.product)
-                    if inventory.stock_level < item.quantity:
-                        unavailable_items.append(f"{item.product.name} (requested: {item.quantity}, available: {inventory.stock_level})")
-                    else:
-                        # Decrement stock atomically
-                        Inventory.objects.filter(pk=inventory.pk, stock_level__gte=item.quantity).update(stock_level=F('stock_level') - item.quantity)
-                        # Re-fetch to confirm update (or check rows_updated from .update())
-                        inventory.refresh_from_db()
-                        if inventory.stock_level < 0: # Should not happen with gte filter but as a safeguard
-                             raise Exception(f"Concurrency issue: Stock for {item.product.name} went negative.")
-
-
-                if unavailable_items:
-                    error_message = f"Insufficient stock for items: {', '.join(unavailable_items)}"
-                    print(f"Order {order_id}: {error_message}")
-                    update_order_status(order, Order.OrderStatus.FAILED, notes=error_message)
+                # Lock the order before the inventory (the same order as cancellation) and re-check it
+                order = Order.objects.select_for_update().get(id=order_id)
+                if order.status != Order.OrderStatus.PROCESSING:
+                    logger.info("Order is no longer PROCESSING, skipping", extra=_log_context(self, order_id, event='task.skipped', status=order.status))
+                    return
+                order_items_to_check = list(order.items.select_related('product').all())
+                demand = demand_by_product((item.product_id, item.quantity) for item in order_items_to_check)
+                # All or nothing: stock is only taken once every item can be filled (orders/allocation.py)
+                shortages = allocate_order(order, demand)
+
+                if shortages:
+                    details = ', '.join(
+                        f"{item.product.name} (requested: {item.quantity}, available: {shortages[item.product_id]})"
+                        for item in order_items_to_check if item.product_id in shortages
+                    )
+                    if settings.ORDER_BACKORDERS_ENABLED:
+                        # Wait for a restock instead of failing; see orders/backorders.py
+                        backorder_order(order, shortages, notes=f"Backordered, waiting for stock: {details}")
+                        logger.info("Order backordered", extra=_log_context(self, order_id, event='task.backordered', duration_ms=_elapsed_ms(started)))
+                        return
+                    update_order_status(order, Order.OrderStatus.FAILED, notes=f"Insufficient stock for items: {details}")
                     return # Stop processing this order
 
+                # If all items available and stock decremented
+                update_order_status(
+                    order,
+                    Order.OrderStatus.PACKAGING,
+                    notes="Inventory allocated, order is being packaged.",
+                    expected_eta_delta_seconds=int(settings.ORDER_SHIPPING_DELAY_MAX * 1.5) # Time for packaging + shipping
+                )
+
         except Inventory.DoesNotExist:
             update_order_status(order, Order.OrderStatus.FAILED, notes="Critical error: Inventory record missing for a product.")
             return
         except Exception as e: # Catch broader exceptions during inventory logic
-            print(f"Error during inventory check for order {order_id}: {e}")
+            if is_transient_error(e):
+                raise # Lock timeouts, serialization failures etc. are retried by the outer handler
+            logger.error("Inventory processing error", exc_info=e, extra=_log_context(self, order_id, event='task.failed', stage='inventory', error=repr(e)))
             update_order_status(order, Order.OrderStatus.FAILED, notes=f"Inventory processing error: {e}")
-            # Potentially retry if it's a transient DB issue, but for stock issues, it's usually a fail
-            # self.retry(exc=e) # Be cautious with retrying inventory logic
             return
 
-        # If all items available and stock decremented
-        print(f"Order {order_id}: Inventory allocated.")
-        update_order_status(
-            order,
-            Order.OrderStatus.PACKAGING,
-            notes="Inventory allocated, order is being packaged.",
-            expected_eta_delta_seconds=int(settings.ORDER_SHIPPING_DELAY_MAX * 1.5) # Time for packaging + shipping
-        )
         # Simulate packaging
-        time.sleep(get_simulated_delay(settings.ORDER_PROCESSING_DELAY_MIN / 2, settings.ORDER_PROCESSING_DELAY_MAX / 2))
+        get_clock().sleep(get_simulated_delay(settings.ORDER_PROCESSING_DELAY_MIN / 2, settings.ORDER_PROCESSING_DELAY_MAX / 2))
 
         # Enqueue next task (shipping)
-        ship_order_task.delay(order.id)
+        get_clock().enqueue(ship_order_task, order.id)
+        logger.info("Order processed", extra=_log_context(self, order_id, event='task.completed', duration_ms=_elapsed_ms(started)))
 
     except Order.DoesNotExist:
-        print(f"Order {order_id} not found in process_order_task.")
+        logger.warning("Order not found", extra=_log_context(self, order_id, event='task.order_missing'))
     except Exception as exc:
-        print(f"Error processing order {order_id}: {exc}")
-        try:
-            order = Order.objects.get(id=order_id)
-            update_order_status(order, Order.OrderStatus.FAILED, notes=f"Unhandled exception in processing: {exc}")
-        except Order.DoesNotExist:
-            pass # Order not found, nothing to update
-        self.retry(exc=exc)
+        retry_or_fail(self, order_id, exc, "processing", int(settings.ORDER_PROCESSING_DELAY_MAX * 1.5))
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=120)
 def ship_order_task(self, order_id):
+    if defer_while_db_unhealthy(self, order_id):
+        return
+    started = time.perf_counter()
     try:
-        order = Order.objects.get(id=order_id)
-        if order.status != Order.OrderStatus.PACKAGING:
-            print(f"Order {order_id} is not PACKAGING, skipping ship_order_task. Current status: {order.status}")
-            return
-
-        print(f"Task: Shipping order {order_id}")
-        update_order_status(
-            order,
-            Order.OrderStatus.SHIPPED,
-            notes="Order has been shipped.",
-            expected_eta_delta_seconds=int(settings.ORDER_DELIVERY_DELAY_MAX * 1.5) # Time for delivery
-        )
-        time.sleep(get_simulated_delay(settings.ORDER_SHIPPING_DELAY_MIN, settings.ORDER_SHIPPING_DELAY_MAX))
+        with transaction.atomic():
+            # Row lock: a concurrent cancellation either lands first (and we skip) or waits for us
+            order = Order.objects.select_for_update().get(id=order_id)
+            if order.status != Order.OrderStatus.PACKAGING:
+                logger.info("Order is not PACKAGING, skipping", extra=_log_context(self, order_id, event='task.skipped', status=order.status))
+                return
+
+            logger.debug("Shipping order", extra=_log_context(self, order_id, event='task.started', retry=self.request.retries))
+            update_order_status(
+                order,
+                Order.OrderStatus.SHIPPED,
+                notes="Order has been shipped.",
+                expected_eta_delta_seconds=int(settings.ORDER_DELIVERY_DELAY_MAX * 1.5) # Time for delivery
+            )
+        get_clock().sleep(get_simulated_delay(settings.ORDER_SHIPPING_DELAY_MIN, settings.ORDER_SHIPPING_DELAY_MAX))
 
         # Enqueue next task (delivery)
-        deliver_order_task.delay(order.id)
+        get_clock().enqueue(deliver_order_task, order.id)
+        logger.info("Order shipped", extra=_log_context(self, order_id, event='task.completed', duration_ms=_elapsed_ms(started)))
 
     except Order.DoesNotExist:
-        print(f"Order {order_id} not found in ship_order_task.")
+        logger.warning("Order not found", extra=_log_context(self, order_id, event='task.order_missing'))
     except Exception as exc:
-        print(f"Error shipping order {order_id}: {exc}")
-        try:
-            order = Order.objects.get(id=order_id)
-            update_order_status(order, Order.OrderStatus.FAILED, notes=f"Unhandled exception in shipping: {exc}")
-        except Order.DoesNotExist:
-            pass
-        self.retry(exc=exc)
+        retry_or_fail(self, order_id, exc, "shipping", int(settings.ORDER_SHIPPING_DELAY_MAX * 1.5))
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=180)
 def deliver_order_task(self, order_id):
+    if defer_while_db_unhealthy(self, order_id):
+        return
+    started = time.perf_counter()
     try:
         order = Order.objects.get(id=order_id)
         if order.status != Order.OrderStatus.SHIPPED:
-            print(f"Order {order_id} is not SHIPPED, skipping deliver_order_task. Current status: {order.status}")
+            logger.info("Order is not SHIPPED, skipping", extra=_log_context(self, order_id, event='task.skipped', status=order.status))
             return
 
-        print(f"Task: Delivering order {order_id}")
+        logger.debug("Delivering order", extra=_log_context(self, order_id, event='task.started', retry=self.request.retries))
         # No next ETA for delivered status
         update_order_status(order, Order.OrderStatus.DELIVERED, notes="Order has been delivered.")
-        time.sleep(get_simulated_delay(settings.ORDER_DELIVERY_DELAY_MIN, settings.ORDER_DELIVERY_DELAY_MAX))
-        print(f"Order {order_id} successfully delivered.")
+        get_clock().sleep(get_simulated_delay(settings.ORDER_DELIVERY_DELAY_MIN, settings.ORDER_DELIVERY_DELAY_MAX))
+        logger.info("Order delivered", extra=_log_context(self, order_id, event='task.completed', duration_ms=_elapsed_ms(started)))
 
     except Order.DoesNotExist:
-        print(f"Order {order_id} not found in deliver_order_task.")
+        logger.warning("Order not found", extra=_log_context(self, order_id, event='task.order_missing'))
     except Exception as exc:
-        print(f"Error delivering order {order_id}: {exc}")
-        try:
-            order = Order.objects.get(id=order_id)
-            update_order_status(order, Order.OrderStatus.FAILED, notes=f"Unhandled exception in delivery: {exc}")
-        except Order.DoesNotExist:
-            pass
-        self.retry(exc=exc)
+        retry_or_fail(self, order_id, exc, "delivery", int(settings.ORDER_DELIVERY_DELAY_MAX * 1.5))
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def allocate_backorders_task(self, product_ids):
+    """
+    Serve the backorder queues of restocked products (queued by notify_restock), oldest orders first.
+    Each pass handles ORDER_BACKORDER_BATCH_SIZE orders; a full batch that made progress queues another pass.
+    """
+    try:
+        allocated, more = allocate_backorders(product_ids, settings.ORDER_BACKORDER_BATCH_SIZE)
+    except Exception as exc:
+        if not is_transient_error(exc) or self.request.retries >= self.max_retries:
+            raise
+        db_breaker.record_failure()
+        get_clock().retry(self, backoff_delay(self.request.retries, self.default_retry_delay), exc=exc)
+        return 0
+    if allocated and more:
+        get_clock().enqueue(allocate_backorders_task, product_ids)
+    return len(allocated)
+
+
+# --- Stale Order Handling ---
+def handle_stale_order(order, now=None):
+    # Basic resolution: Mark as FAILED.
+    # More sophisticated: Could try to re-queue the appropriate task if idempotent,
+    # or escalate to a manual review queue.
+    # For this simulation, we'll mark as FAILED.
+    # Returns whether the order was failed.
+    now = now or get_clock().now()
+    with transaction.atomic():
+        # `order` was read without a lock: it may have been canceled, advanced or had its ETA
+        # postponed since. Re-check under the row lock so we never overwrite such a change.
+        order = Order.objects.select_for_update().stale(now).filter(pk=order.pk).first()
+        if order is None:
+            return False
+        # Captured before the update clears the ETA and bumps updated_at
+        last_status, expected_eta, updated_at = order.status, order.expected_next_task_eta, order.updated_at
+        update_order_status(
+            order,
+            Order.OrderStatus.FAILED,
+            notes=f"Order automatically marked as FAILED due to being stale. Last status: {last_status}. Expected ETA: {expected_eta}."
+        )
+    logger.warning("Stale order marked as FAILED", extra={
+        'event': 'order.stale', 'order_id': str(order.id), 'from_status': last_status,
+        'expected_eta': expected_eta, 'updated_at': updated_at,
+    })
+
+    # Example of re-queuing (use with caution, ensure tasks are idempotent)
+    # if order.status == Order.OrderStatus.PENDING or order.status == Order.OrderStatus.PROCESSING:
+    #     logger.info(f"Re-queueing process_order_task for stale order {order.id}")
+    #     process_order_task.delay(order.id) # This might lead to loops if not careful
+    # elif order.status == Order.OrderStatus.PACKAGING:
+    #     # (Assuming process_order_task moves it to PACKAGING, then ship_order_task is next)
+    #     logger.info(f"Re-queueing ship_order_task for stale order {order.id}")
+    #     ship_order_task.delay(order.id)
+    # elif order.status == Order.OrderStatus.SHIPPED:
+    #     logger.info(f"Re-queueing deliver_order_task for stale order {order.id}")
+    #     deliver_order_task.delay(order.id)
+    return True
+
+
+def _expire_from_index(index, now, batch_size):
+    if index.needs_rebuild:
+        rebuild_deadline_index(index=index)
+
+    expired = 0
+    while True:
+        due_ids = index.pop_due(now.timestamp(), batch_size)
+        if not due_ids:
+            break
+
+        # The index is only a hint: apply exactly the stale detector's query to the popped ids
+        stale_ids = set()
+        for order in Order.objects.stale(now).filter(pk__in=due_ids):
+            if handle_stale_order(order, now):
+                stale_ids.add(str(order.pk))
+                expired += 1
+
+        # Anything else was popped from a stale entry; put back the live deadline, if any
+        leftover = [order_id for order_id in due_ids if order_id not in stale_ids]
+        for order_id, eta in Order.objects.in_flight().filter(pk__in=leftover, expected_next_task_eta__gte=now).values_list('id', 'expected_next_task_eta'):
+            index.add(order_id, eta.timestamp())
+
+        if len(due_ids) < batch_size:
+            break
+    return expired
+
+
+def _expire_from_database(now, batch_size):
+    expired = 0
+    while True:
+        # Served by order_in_flight_eta_idx: only overdue in-flight rows are read, oldest deadline first
+        due = list(Order.objects.stale(now).order_by('expected_next_task_eta')[:batch_size])
+        # Orders that changed in the meantime are skipped and no longer match, so this terminates
+        expired += sum(handle_stale_order(order, now) for order in due)
+        if len(due) < batch_size:
+            return expired
+
+
+@shared_task
+def expire_due_orders(batch_size=1000):
+    """
+    Fail the orders whose deadline has passed, driven by the deadline index instead of a table scan.
+    Beat runs this every STALE_DEADLINE_POLL_SECONDS, so an order expires within that long of its ETA.
+    Without a shared index (STALE_DEADLINE_INDEX_URL) the due orders are read from the partial ETA
+    index in the database.
+    """
+    if stale_detection_paused():
+        return 0
+
+    now = get_clock().now()
+    index = get_deadline_index()
+    if index is not None:
+        expired = _expire_from_index(index, now, batch_size)
+    else:
+        expired = _expire_from_database(now, batch_size)
+
+    if expired:
+        logger.info("Expired stale orders", extra={'event': 'stale.expired', 'count': expired})
+    return expired
+
+
+@shared_task
+def reconcile_deadline_index():
+    """Rebuild the deadline index from the database to repair any drift (e.g. a lost Redis)."""
+    size = rebuild_deadline_index()
+    if size is None:
+        return None  # No shared index configured; beat only schedules this when there is one
+    logger.info("Deadline index rebuilt", extra={'event': 'deadlines.rebuilt', 'count': size})
+    return size
 
 
-# --- Stale Order Handling Task (triggered by Celery Beat) ---
 @shared_task
 def detect_and_handle_stale_orders():
-    print("Running stale order detection task...")
-    stale_threshold_time = timezone.now() - datetime.timedelta(minutes=settings.STALE_ORDER_THRESHOLD_MINUTES)
+    """
+    Full-table stale scan. Beat uses the deadline index (expire_due_orders) instead; this stays
+    for one-off sweeps and the simulator.
+    """
+    if stale_detection_paused():  # Deferred tasks are waiting on the database too
+        return
+
+    logger.debug("Running stale order detection", extra={'event': 'stale.scan'})
+    now = get_clock().now()
+    stale_threshold_time = now - datetime.timedelta(minutes=settings.STALE_ORDER_THRESHOLD_MINUTES)
 
     # Find orders in transitional states that haven't been updated recently
     # AND where their expected_next_task_eta has passed
-    stale_orders = Order.objects.filter(
-        status__in=[
-            Order.OrderStatus.PENDING,
-            Order.OrderStatus.PROCESSING,
-            Order.OrderStatus.PACKAGING,
-            Order.OrderStatus.SHIPPED,
-        ],
-        # updated_at__lt=stale_threshold_time, # Alternative: check if updated_at is old
-        expected_next_task_eta__lt=timezone.now() # Check if expected ETA has passed
-    ).exclude(expected_next_task_eta__isnull=True) # Only consider orders with an ETA
+    # (alternative: also require updated_at__lt=stale_threshold_time)
+    stale_orders = Order.objects.stale(now)
 
     if not stale_orders.exists():
-        print("No stale orders found.")
         return
 
-    print(f"Found {stale_orders.count()} potentially stale orders.")
+    logger.info("Found potentially stale orders", extra={'event': 'stale.found', 'count': stale_orders.count()})
     for order in stale_orders:
-        print(f"Stale order detected: {order.id}, Status: {order.status}, Expected ETA: {order.expected_next_task_eta}, Last Updated: {order.updated_at}")
-
-        # Basic resolution: Mark as FAILED.
-        # More sophisticated: Could try to re-queue the appropriate task if idempotent,
-        # or escalate to a manual review queue.
-        # For this simulation, we'll mark as FAILED.
-        update_order_status(
-            order,
-            Order.OrderStatus.FAILED,
-            notes=f"Order automatically marked as FAILED due to being stale. Last status: {order.status}. Expected ETA: {order.expected_next_task_eta}."
-        )
-        print(f"Order {order.id} marked as FAILED due to staleness.")
-
-        # Example of re-queuing (use with caution, ensure tasks are idempotent)
-        # if order.status == Order.OrderStatus.PENDING or order.status == Order.OrderStatus.PROCESSING:
-        #     print(f"Re-queueing process_order_task for stale order {order.id}")
-        #     process_order_task.delay(order.id) # This might lead to loops if not careful
-        # elif order.status == Order.OrderStatus.PACKAGING:
-        #     # (Assuming process_order_task moves it to PACKAGING, then ship_order_task is next)
-        #     print(f"Re-queueing ship_order_task for stale order {order.id}")
-        #     ship_order_task.delay(order.id)
-        # elif order.status == Order.OrderStatus.SHIPPED:
-        #     print(f"Re-queueing deliver_order_task for stale order {order.id}")
-        #     deliver_order_task.delay(order.id)
\ No newline at end of file
+        handle_stale_order(order, now)
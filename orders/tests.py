@@ -1,3 +1,708 @@
-from django.test import TestCase
+import datetime
+import logging
+import uuid
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import psycopg
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, OperationalError, transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from products.models import Inventory, Location, Product
+
+from .allocation import ALLOCATION_STRATEGIES, SplitShipment, allocate_order, get_allocation_strategy
+from .clock import SystemClock, use_clock
+from .dataset import DatasetGenerator
+from .deadlines import InMemoryDeadlineIndex, get_deadline_index, rebuild_deadline_index
+from .models import Allocation, Backorder, Order, OrderHistory, OrderItem, postpone_expected_eta, update_order_status
+from .retry import CircuitBreaker, db_breaker, is_transient_error
+from .simulation import FulfilmentSimulation
+from .tasks import (
+    allocate_backorders_task, expire_due_orders, handle_stale_order, process_order_task, reconcile_deadline_index,
+)
+
+
+def setUpModule():
+    logging.disable(logging.CRITICAL) # Lifecycle logs are noise here
+
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+
+class FakeClock(SystemClock):
+    """Controllable "now"; records enqueued tasks and retries instead of talking to the broker."""
+
+    def __init__(self, now=None):
+        self.current = now or timezone.now()
+        self.enqueued = []
+        self.retries = []
+
+    def now(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += datetime.timedelta(seconds=seconds)
+
+    def sleep(self, seconds):
+        pass
+
+    def enqueue(self, task, *args, countdown=None):
+        self.enqueued.append((task.name, args, countdown))
+
+    def retry(self, task, countdown, exc=None):
+        self.retries.append((task.name, countdown, exc))
+
+
+def make_product(sku, stock=10, price='10.00', location=None):
+    product = Product.objects.create(name=f"Product {sku}", sku=sku, price=price)
+    location = location or Location.objects.get(code=Location.DEFAULT_CODE)
+    Inventory.objects.create(product=product, location=location, stock_level=stock)
+    return product
+
+
+def make_order(lines, status=Order.OrderStatus.PENDING, **fields):
+    """`lines` is [(product, quantity)]."""
+    order = Order.objects.create(customer_name="Test Customer", status=status, **fields)
+    for product, quantity in lines:
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_purchase=product.price)
+    return order
+
+
+class ClockTestCase(TestCase):
+    def setUp(self):
+        cache.clear() # Circuit breaker state
+        self.clock = FakeClock()
+        context = use_clock(self.clock)
+        context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+
+
+class TransientErrorTests(TestCase):
+    def test_classification(self):
+        self.assertTrue(is_transient_error(OperationalError("server closed the connection")))
+        self.assertFalse(is_transient_error(IntegrityError("duplicate key")))
+        self.assertFalse(is_transient_error(ValueError("bad input")))
+
+        deadlock = IntegrityError("deadlock detected")
+        deadlock.pgcode = '40P01'  # psycopg2
+        self.assertTrue(is_transient_error(deadlock))
+
+    def test_psycopg_errors(self):
+        # Django wraps driver errors and keeps the original as __cause__; psycopg 3 exposes `sqlstate`
+        for code, transient in [('40P01', True), ('55P03', True), ('08006', True), ('23505', False), ('25P02', False)]:
+            cause = psycopg.errors.lookup(code)("from the driver")
+            error = DatabaseError("wrapped")
+            error.__cause__ = cause
+            with self.subTest(code=code):
+                self.assertEqual(cause.sqlstate, code)
+                self.assertIs(is_transient_error(error), transient)
+
+
+class CircuitBreakerTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.probe = mock.Mock(return_value=True)
+        self.breaker = CircuitBreaker('test', failure_threshold=3, window_seconds=60, reset_seconds=30, probe=self.probe)
+
+    def test_opens_at_threshold_and_closes_after_successful_probe(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.closed_within(60))
+        self.assertAlmostEqual(self.breaker.retry_after(), 30, delta=1)
+
+        self.clock.advance(31)
+        self.assertEqual(self.breaker.retry_after(), 0)
+        self.probe.assert_called_once()
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.closed_within(10))
+        self.clock.advance(10)
+        self.assertFalse(self.breaker.closed_within(10))
+
+    def test_failed_probe_reopens(self):
+        self.probe.return_value = False
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.advance(31)
+        self.assertEqual(self.breaker.retry_after(), 30)
+        self.assertTrue(self.breaker.is_open())
+
+
+class TaskRetryTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product('RETRY-1', stock=5)
+        self.order = make_order([(self.product, 2)])
+
+    def test_transient_error_is_retried_with_eta_postponed(self):
+        with mock.patch('orders.tasks.allocate_order', side_effect=OperationalError("connection lost")):
+            process_order_task.apply(args=[self.order.pk])
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.PROCESSING)
+        self.assertEqual(len(self.clock.retries), 1)
+        countdown = self.clock.retries[0][1]
+        # The stale detector must not fail the order while it waits for the retry
+        self.assertGreaterEqual(self.order.expected_next_task_eta, self.clock.now() + datetime.timedelta(seconds=countdown))
+
+    def test_retry_resumes_processing_order(self):
+        with mock.patch('orders.tasks.allocate_order', side_effect=OperationalError("connection lost")):
+            process_order_task.apply(args=[self.order.pk])
+        process_order_task.apply(args=[self.order.pk], retries=1)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.PACKAGING)
+        self.assertEqual(Inventory.objects.get(product=self.product).stock_level, 3)
+
+    def test_exhausted_retries_fail_the_order(self):
+        self.order.status = Order.OrderStatus.PROCESSING
+        self.order.save()
+        with mock.patch('orders.tasks.allocate_order', side_effect=OperationalError("connection lost")):
+            process_order_task.apply(args=[self.order.pk], retries=process_order_task.max_retries)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.FAILED)
+        self.assertIn("gave up", self.order.history.last().notes)
+        self.assertEqual(self.clock.retries, [])
+
+    def test_permanent_error_fails_without_retry(self):
+        with mock.patch('orders.tasks.allocate_order', side_effect=RuntimeError("bug")):
+            process_order_task.apply(args=[self.order.pk])
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.FAILED)
+        self.assertEqual(self.clock.retries, [])
+
+    def test_open_breaker_defers_until_the_database_recovers(self):
+        for _ in range(db_breaker.failure_threshold):
+            db_breaker.record_failure()
+
+        process_order_task.apply(args=[self.order.pk])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.PENDING)
+        [(name, args, countdown)] = self.clock.enqueued
+        self.assertEqual((name, args), (process_order_task.name, (self.order.pk,)))
+        self.assertGreaterEqual(countdown, db_breaker.reset_seconds - 1)
+
+        # Past the reset window the probe (SELECT 1) succeeds, the breaker closes and work resumes
+        self.clock.advance(db_breaker.reset_seconds + 1)
+        process_order_task.apply(args=[self.order.pk])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.OrderStatus.PACKAGING)
+        self.assertFalse(db_breaker.is_open())
+
+
+class DeadlineExpiryTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product('STALE-1')
+
+    def make_order(self, status, eta_seconds):
+        eta = self.clock.now() + datetime.timedelta(seconds=eta_seconds)
+        return make_order([(self.product, 1)], status=status, expected_next_task_eta=eta)
+
+    @override_settings(STALE_DEADLINE_INDEX_URL=None)
+    def test_without_shared_index_due_orders_are_read_from_the_database(self):
+        # Set by "another process": no in-memory index of this one has seen these ETAs
+        overdue = self.make_order(Order.OrderStatus.PROCESSING, -60)
+        live = self.make_order(Order.OrderStatus.PACKAGING, 60)
+        final = self.make_order(Order.OrderStatus.DELIVERED, -60)
+
+        self.assertEqual(expire_due_orders(), 1)
+        self.assertEqual(Order.objects.get(pk=overdue.pk).status, Order.OrderStatus.FAILED)
+        self.assertEqual(Order.objects.get(pk=live.pk).status, Order.OrderStatus.PACKAGING)
+        self.assertEqual(Order.objects.get(pk=final.pk).status, Order.OrderStatus.DELIVERED)
+
+    @override_settings(STALE_DEADLINE_INDEX_URL=None)
+    def test_stale_log_has_the_deadline_that_passed(self):
+        order = self.make_order(Order.OrderStatus.PACKAGING, -60)
+        logging.disable(logging.NOTSET)
+        self.addCleanup(logging.disable, logging.CRITICAL)
+        with self.assertLogs('orders', logging.WARNING) as logs:
+            expire_due_orders()
+        [record] = [record for record in logs.records if getattr(record, 'event', None) == 'order.stale']
+        self.assertEqual((record.from_status, record.expected_eta, record.updated_at),
+                         (Order.OrderStatus.PACKAGING, order.expected_next_task_eta, order.updated_at))
+
+    @override_settings(STALE_DEADLINE_INDEX_URL=None)
+    def test_expires_in_batches(self):
+        for _ in range(5):
+            self.make_order(Order.OrderStatus.SHIPPED, -60)
+        self.assertEqual(expire_due_orders(batch_size=2), 5)
+        self.assertFalse(Order.objects.stale(self.clock.now()).exists())
+
+    @override_settings(STALE_DEADLINE_INDEX_URL='redis://deadline-index')
+    def test_shared_index_entries_are_rechecked_against_the_database(self):
+        overdue = self.make_order(Order.OrderStatus.PROCESSING, -60)
+        postponed = self.make_order(Order.OrderStatus.PROCESSING, 600) # Retry pushed the ETA out
+        index = InMemoryDeadlineIndex()
+        index.needs_rebuild = False
+        past = (self.clock.now() - datetime.timedelta(seconds=60)).timestamp()
+        index.add_many([(overdue.pk, past), (postponed.pk, past)])
+
+        with mock.patch('orders.tasks.get_deadline_index', return_value=index):
+            self.assertEqual(expire_due_orders(), 1)
+
+        self.assertEqual(Order.objects.get(pk=overdue.pk).status, Order.OrderStatus.FAILED)
+        self.assertEqual(Order.objects.get(pk=postponed.pk).status, Order.OrderStatus.PROCESSING)
+        self.assertEqual(index.next_deadline(), postponed.expected_next_task_eta.timestamp())
+
+
+@override_settings(STALE_DEADLINE_INDEX_URL=None)
+class BreakerStaleExpiryTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        # Created just before the outage; its processing task is being deferred
+        self.order = make_order([(make_product('BROWNOUT-1'), 1)], expected_next_task_eta=self.clock.now() + datetime.timedelta(seconds=30))
+        for _ in range(db_breaker.failure_threshold):
+            db_breaker.record_failure()
+
+    def status(self):
+        return Order.objects.get(pk=self.order.pk).status
+
+    def test_orders_delayed_by_an_outage_are_not_failed_when_the_breaker_closes(self):
+        process_order_task.apply(args=[self.order.pk])  # Deferred
+        [(_, _, countdown)] = self.clock.enqueued
+        self.clock.advance(db_breaker.reset_seconds + 1)  # ETA long past; the sweeper's probe closes the breaker
+
+        self.assertEqual(expire_due_orders(), 0)
+        self.assertFalse(db_breaker.is_open())
+        self.assertEqual(self.status(), Order.OrderStatus.PENDING)
+
+        # The deferred task comes back within the grace period and moves the order on
+        self.clock.advance(countdown - db_breaker.reset_seconds)
+        self.assertEqual(expire_due_orders(), 0)
+        process_order_task.apply(args=[self.order.pk])
+        self.assertEqual(self.status(), Order.OrderStatus.PACKAGING)
+
+    def test_orders_whose_task_never_returns_expire_after_the_grace_period(self):
+        self.clock.advance(db_breaker.reset_seconds + 1)
+        self.assertEqual(expire_due_orders(), 0)
+
+        self.clock.advance(2 * db_breaker.reset_seconds)
+        self.assertEqual(expire_due_orders(), 1)
+        self.assertEqual(self.status(), Order.OrderStatus.FAILED)
+
+
+class DeadlineIndexSyncTests(ClockTestCase):
+    @override_settings(STALE_DEADLINE_INDEX_URL=None)
+    def test_without_shared_index_nothing_is_mirrored(self):
+        order = make_order([(make_product('SYNC-1'), 1)])
+        with mock.patch('orders.deadlines.get_deadline_index') as get_index:
+            with self.captureOnCommitCallbacks(execute=True):
+                for status in (Order.OrderStatus.PROCESSING, Order.OrderStatus.PACKAGING):
+                    update_order_status(order, status, expected_eta_delta_seconds=60)
+                postpone_expected_eta(order.pk, 600)
+        get_index.assert_not_called()
+        self.assertIsNone(get_deadline_index())
+        self.assertIsNone(reconcile_deadline_index.apply().get())
+
+    @override_settings(STALE_DEADLINE_INDEX_URL='redis://deadline-index')
+    def test_rebuild_keeps_etas_written_while_it_ran(self):
+        product = make_product('SYNC-2')
+        eta = self.clock.now() + datetime.timedelta(seconds=60)
+        snapshotted = make_order([(product, 1)], status=Order.OrderStatus.PROCESSING, expected_next_task_eta=eta)
+        late = make_order([(product, 1)])
+        test = self
+
+        class RacingIndex(InMemoryDeadlineIndex):
+            def replace(self, entries):
+                entries = list(entries)  # The snapshot is read first...
+                # ...then another process moves an order into flight and mirrors its ETA
+                with test.captureOnCommitCallbacks(execute=True):
+                    update_order_status(Order.objects.get(pk=late.pk), Order.OrderStatus.PROCESSING, expected_eta_delta_seconds=90)
+                super().replace(entries)  # ...and the swap drops that entry
+
+        index = RacingIndex()
+        with mock.patch('orders.deadlines.get_deadline_index', return_value=index):
+            self.assertEqual(rebuild_deadline_index(), 2)
+        self.assertEqual(index._deadlines[str(snapshotted.pk)], eta.timestamp())
+        self.assertEqual(index._deadlines[str(late.pk)], Order.objects.get(pk=late.pk).expected_next_task_eta.timestamp())
+
+
+class OrderTotalsTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.cheap = make_product('TOTAL-1', price='2.50')
+        self.dear = make_product('TOTAL-2', price='40.00')
+
+    def test_totals_are_stored_at_creation(self):
+        response = self.client.post('/api/orders/', {
+            'customer_name': "Totals", 'items': [{'product_id': self.cheap.pk, 'quantity': 4}, {'product_id': self.dear.pk, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual((order.total_amount, order.item_count, order.total_units), (Decimal('50.00'), 2, 5))
+
+        response = self.client.post('/api/orders/bulk/', [
+            {'customer_name': "Bulk", 'items': [{'product_id': self.dear.pk, 'quantity': 2}]},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        order = Order.objects.get(customer_name="Bulk")
+        self.assertEqual((order.total_amount, order.item_count, order.total_units), (Decimal('80.00'), 1, 2))
+
+    def test_range_filters(self):
+        small = make_order([(self.cheap, 1)], total_amount='2.50', item_count=1, total_units=1)
+        medium = make_order([(self.dear, 1)], total_amount='40.00', item_count=1, total_units=1)
+        large = make_order([(self.cheap, 2), (self.dear, 2)], total_amount='85.00', item_count=2, total_units=4)
+
+        def ids(query):
+            response = self.client.get(f'/api/orders/?{query}')
+            self.assertEqual(response.status_code, 200)
+            return {order['id'] for order in response.data}
+
+        self.assertEqual(ids('min_total=10&max_total=50'), {str(medium.pk)})
+        self.assertEqual(ids('min_items=2'), {str(large.pk)})
+        self.assertEqual(ids('max_total=&ordering=-total_amount'), {str(small.pk), str(medium.pk), str(large.pk)})
+
+    def test_invalid_filters_are_rejected(self):
+        for query in ['min_total=NaN', 'max_total=Infinity', 'min_total=-inf', 'min_total=abc', 'max_total=1e20', 'min_items=x', 'max_items=-1']:
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/orders/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(query.split('=')[0], response.data)
+
+
+class BatchStatusTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        product = make_product('STATUS-1')
+        eta = self.clock.now() + datetime.timedelta(seconds=60)
+        self.processing = make_order([(product, 1)], status=Order.OrderStatus.PROCESSING, expected_next_task_eta=eta)
+        self.shipped = make_order([(product, 1)], status=Order.OrderStatus.SHIPPED)
+        # Both last changed an hour ago
+        Order.objects.update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+
+    def poll(self, **payload):
+        response = self.client.post('/api/orders/status/', {'ids': [self.processing.pk, self.shipped.pk], **payload}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_lookup_ignores_unknown_ids(self):
+        response = self.client.post('/api/orders/status/', {'ids': [self.shipped.pk, uuid.uuid4()]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(o['id'], o['status']) for o in response.data['orders']], [(str(self.shipped.pk), Order.OrderStatus.SHIPPED)])
+
+    def test_delta_returns_only_orders_changed_since(self):
+        cursor = self.poll()['next_updated_since']
+        self.assertEqual(self.poll(updated_since=cursor)['orders'], [])
+
+        update_order_status(self.shipped, Order.OrderStatus.DELIVERED)
+        self.assertEqual([o['id'] for o in self.poll(updated_since=cursor)['orders']], [str(self.shipped.pk)])
+
+    def test_postponed_eta_shows_up_in_the_delta(self):
+        cursor = timezone.now() - datetime.timedelta(minutes=1)
+        postpone_expected_eta(self.processing.pk, 600)
+
+        [changed] = self.poll(updated_since=cursor.isoformat())['orders']
+        self.assertEqual(changed['id'], str(self.processing.pk))
+        self.assertEqual(parse_datetime(changed['expected_next_task_eta']), self.clock.now() + datetime.timedelta(seconds=600))
+
+
+@override_settings(ORDER_BACKORDERS_ENABLED=True)
+class BackorderTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product('BACK-1', stock=0)
+        self.other = make_product('BACK-2', stock=0)
+        self.inventory = Inventory.objects.get(product=self.product)
+
+    def backorder(self, lines, minutes_ago):
+        order = make_order(lines)
+        process_order_task.apply(args=[order.pk])
+        order.backorders.update(created_at=self.clock.now() - datetime.timedelta(minutes=minutes_ago))
+        return order
+
+    def restock(self, stock_level, inventory=None):
+        inventory = inventory or self.inventory
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post(f'/api/inventory/{inventory.pk}/update-stock/', {'stock_level': stock_level}, format='json')
+        self.assertEqual(response.status_code, 200)
+        [(name, (product_ids,), _)] = self.clock.enqueued
+        self.assertEqual(name, allocate_backorders_task.name)
+        self.clock.enqueued.clear()
+        with self.captureOnCommitCallbacks(execute=True): # Shipping is queued once the allocation commits
+            return allocate_backorders_task.apply(args=[product_ids]).get()
+
+    def status(self, order):
+        return Order.objects.get(pk=order.pk).status
+
+    def test_short_order_waits_instead_of_failing(self):
+        order = self.backorder([(self.product, 2), (self.other, 1)], minutes_ago=0)
+        self.assertEqual(self.status(order), Order.OrderStatus.BACKORDERED)
+        self.assertEqual(set(order.backorders.values_list('product_id', flat=True)), {self.product.pk, self.other.pk})
+
+    def test_restock_serves_oldest_first_without_letting_younger_orders_jump_the_queue(self):
+        large = self.backorder([(self.product, 5)], minutes_ago=3)
+        small = self.backorder([(self.product, 1)], minutes_ago=2)
+        also_small = self.backorder([(self.product, 1)], minutes_ago=1)
+
+        # Enough for the small orders but not the oldest one: nobody overtakes it
+        self.assertEqual(self.restock(3), 0)
+        self.assertEqual({self.status(o) for o in (large, small, also_small)}, {Order.OrderStatus.BACKORDERED})
+
+        self.assertEqual(self.restock(6), 2)
+        self.assertEqual(self.status(large), Order.OrderStatus.PACKAGING)
+        self.assertEqual(self.status(small), Order.OrderStatus.PACKAGING)
+        self.assertEqual(self.status(also_small), Order.OrderStatus.BACKORDERED)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).stock_level, 0)
+        self.assertFalse(large.backorders.exists())
+        self.assertEqual(sorted(args[0] for name, args, _ in self.clock.enqueued), sorted([large.pk, small.pk]))
+
+    def test_order_is_queued_for_a_product_that_sold_out_while_it_waited(self):
+        other_inventory = Inventory.objects.get(product=self.other)
+        Inventory.objects.filter(pk=other_inventory.pk).update(stock_level=1)
+        order = self.backorder([(self.product, 1), (self.other, 1)], minutes_ago=0)
+        self.assertEqual(set(order.backorders.values_list('product_id', flat=True)), {self.product.pk})
+
+        Inventory.objects.filter(pk=other_inventory.pk).update(stock_level=0)  # Sold to someone else
+        self.assertEqual(self.restock(5), 0)
+        self.assertEqual(set(order.backorders.values_list('product_id', flat=True)), {self.product.pk, self.other.pk})
+
+        self.assertEqual(self.restock(1, inventory=other_inventory), 1)
+        self.assertEqual(self.status(order), Order.OrderStatus.PACKAGING)
+        self.assertFalse(order.backorders.exists())
+
+    def test_order_waiting_for_another_product_stays_queued(self):
+        order = self.backorder([(self.product, 1), (self.other, 1)], minutes_ago=0)
+        self.assertEqual(self.restock(5), 0)
+        self.assertEqual(self.status(order), Order.OrderStatus.BACKORDERED)
+
+
+class CancellationTests(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.product = make_product('CANCEL-1', stock=10)
+
+    def packaged_order(self, quantity):
+        order = make_order([(self.product, quantity)])
+        process_order_task.apply(args=[order.pk])
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.OrderStatus.PACKAGING)
+        return order
+
+    def stock(self):
+        return Inventory.objects.get(product=self.product).stock_level
+
+    def test_cancel_releases_allocated_stock(self):
+        order = self.packaged_order(3)
+        self.assertEqual(self.stock(), 7)
+
+        response = self.client.post(f'/api/orders/{order.pk}/cancel/', {'notes': "Customer changed their mind"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Order.OrderStatus.CANCELED)
+        self.assertEqual(self.stock(), 10)
+        self.assertFalse(Allocation.objects.filter(order=order).exists())
+        self.assertEqual(order.history.last().notes, "Customer changed their mind")
+
+    def test_shipped_order_cannot_be_canceled(self):
+        order = make_order([(self.product, 1)], status=Order.OrderStatus.SHIPPED)
+        response = self.client.post(f'/api/orders/{order.pk}/cancel/', format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.OrderStatus.SHIPPED)
+
+    def test_bulk_cancel_reports_what_it_could_not_cancel(self):
+        packaged = [self.packaged_order(2), self.packaged_order(1)]
+        pending = make_order([(self.product, 4)])
+        shipped = make_order([(self.product, 1)], status=Order.OrderStatus.SHIPPED)
+        missing = uuid.uuid4()
+        self.assertEqual(self.stock(), 7)
+
+        with override_settings(ORDER_CANCEL_BATCH_SIZE=2): # Several transactions
+            response = self.client.post('/api/orders/cancel/', {'ids': [o.pk for o in (*packaged, pending, shipped)] + [missing]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['canceled']), {str(o.pk) for o in (*packaged, pending)})
+        self.assertEqual(response.data['not_cancelable'], [{'id': str(shipped.pk), 'status': Order.OrderStatus.SHIPPED}])
+        self.assertEqual(response.data['not_found'], [str(missing)])
+        self.assertEqual(self.stock(), 10)
+
+    def test_canceled_order_is_not_failed_as_stale(self):
+        order = make_order([(self.product, 1)], status=Order.OrderStatus.PROCESSING,
+                           expected_next_task_eta=self.clock.now() - datetime.timedelta(seconds=60))
+        stale = Order.objects.stale(self.clock.now()).get(pk=order.pk) # Read by the detector before the cancel
+        self.client.post(f'/api/orders/{order.pk}/cancel/', format='json')
+
+        self.assertFalse(handle_stale_order(stale))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.OrderStatus.CANCELED)
+
+
+class AllocationStrategyTests(TestCase):
+    def setUp(self):
+        self.north = Location.objects.create(code='NORTH', name="North", priority=1)
+        self.south = Location.objects.create(code='SOUTH', name="South", priority=2)
+        self.product = Product.objects.create(name="Widget", sku='ALLOC-1', price='5.00')
+        self.gadget = Product.objects.create(name="Gadget", sku='ALLOC-2', price='5.00')
+        self.rows = {
+            (product, location): Inventory.objects.create(product=product, location=location, stock_level=stock)
+            for product, location, stock in [
+                (self.product, self.north, 3), (self.product, self.south, 8),
+                (self.gadget, self.north, 5), (self.gadget, self.south, 0),
+            ]
+        }
+
+    def allocate(self, demand, strategy):
+        order = make_order([])
+        with transaction.atomic():
+            shortages = allocate_order(order, {product.pk: units for product, units in demand.items()}, get_allocation_strategy(strategy))
+        taken = {(a.inventory.product, a.inventory.location): a.quantity for a in order.allocations.select_related('inventory__product', 'inventory__location')}
+        return shortages, taken
+
+    def stock(self, product, location):
+        return Inventory.objects.get(pk=self.rows[product, location].pk).stock_level
+
+    def test_single_location_first_prefers_one_location_by_priority(self):
+        self.assertEqual(self.allocate({self.product: 2, self.gadget: 1}, 'single-location-first'),
+                         ({}, {(self.product, self.north): 2, (self.gadget, self.north): 1}))
+        # North can't fill 4 widgets, South can fill the whole order
+        self.assertEqual(self.allocate({self.product: 4}, 'single-location-first'), ({}, {(self.product, self.south): 4}))
+
+    def test_single_location_first_splits_by_priority_when_no_location_can_fill(self):
+        self.assertEqual(self.allocate({self.product: 6, self.gadget: 1}, 'single-location-first'),
+                         ({}, {(self.product, self.north): 3, (self.product, self.south): 3, (self.gadget, self.north): 1}))
+
+    def test_split_shipment_takes_from_the_fullest_rows(self):
+        self.assertEqual(self.allocate({self.product: 10}, 'split-shipment'),
+                         ({}, {(self.product, self.south): 8, (self.product, self.north): 2}))
+        self.assertEqual((self.stock(self.product, self.north), self.stock(self.product, self.south)), (1, 0))
+
+    def test_least_contended_uses_a_row_that_can_fill_the_line(self):
+        shortages, taken = self.allocate({self.product: 5}, 'least-contended')
+        self.assertEqual((shortages, taken), ({}, {(self.product, self.south): 5}))
+
+    def test_inactive_locations_are_skipped(self):
+        Location.objects.filter(pk=self.south.pk).update(is_active=False)
+        self.assertEqual(self.allocate({self.product: 4}, 'split-shipment'), ({self.product.pk: 3}, {}))
+        self.assertEqual(self.stock(self.product, self.north), 3)
+
+    def test_shortage_takes_nothing(self):
+        for strategy in ALLOCATION_STRATEGIES:
+            with self.subTest(strategy=strategy):
+                self.assertEqual(self.allocate({self.product: 2, self.gadget: 6}, strategy), ({self.gadget.pk: 5}, {}))
+                self.assertEqual(self.stock(self.product, self.north), 3)
+
+    def test_strategy_by_dotted_path(self):
+        self.assertIsInstance(get_allocation_strategy('orders.allocation.SplitShipment'), SplitShipment)
+
+
+class SimulationTests(TestCase):
+    def setUp(self):
+        cache.clear()  # Circuit breaker state
+
+    def simulate(self, **options):
+        simulation = FulfilmentSimulation(products=3, initial_stock=100, workers=1, **options)
+        return simulation, simulation.run()
+
+    def test_orders_move_through_every_stage_on_virtual_time(self):
+        simulation, report = self.simulate(duration_hours=0.25, orders_per_minute=0.4, seed=0)
+        created = report['orders_created']
+        self.assertGreater(created, 0)
+        self.assertEqual(report['final_status'], {Order.OrderStatus.DELIVERED: created})
+        self.assertEqual((report['failure_rate'], report['task_failures']), (0.0, 0))
+
+        stages = ['PENDING->PROCESSING', 'PROCESSING->PACKAGING', 'PACKAGING->SHIPPED', 'SHIPPED->DELIVERED']
+        self.assertEqual({stage: latency['count'] for stage, latency in report['stage_latency_seconds'].items()},
+                         dict.fromkeys(stages, created))
+        # Each stage took at least its simulated delay; nothing waits in real time for that
+        self.assertGreaterEqual(min(simulation.stage_latencies['PENDING->PROCESSING']), settings.ORDER_PROCESSING_DELAY_MIN / 2)
+        self.assertGreaterEqual(min(simulation.stage_latencies['SHIPPED->DELIVERED']), settings.ORDER_SHIPPING_DELAY_MIN)
+        self.assertEqual(report['end_to_end_seconds']['count'], created)
+        self.assertGreaterEqual(report['end_to_end_seconds']['max'], max(simulation.stage_latencies['SHIPPED->DELIVERED']))
+
+        self.assertEqual(simulation.clock.now() - simulation.clock.start, datetime.timedelta(minutes=15))
+        self.assertEqual(report['inventory_curve'][0]['units_in_stock'], 3 * 100)
+        sold = OrderItem.objects.filter(order__status=Order.OrderStatus.DELIVERED).aggregate(units=Sum('quantity'))['units']
+        self.assertEqual(Inventory.objects.aggregate(units=Sum('stock_level'))['units'], 3 * 100 - sold)
+
+    def test_overloaded_worker_orders_go_stale_on_virtual_time(self):
+        # One worker can't keep up with 6 orders a minute: orders sit PENDING past their 30s ETA
+        simulation, report = self.simulate(duration_hours=0.1, orders_per_minute=6, seed=1)
+        self.assertGreater(report['failure_reasons'].get('stale in PENDING', 0), 0)
+        self.assertEqual(report['final_status'][Order.OrderStatus.FAILED], sum(report['failure_reasons'].values()))
+        self.assertEqual(report['final_status'][Order.OrderStatus.FAILED]
+                         + report['final_status'][Order.OrderStatus.DELIVERED], report['orders_created'])
+        # Failed only once the virtual clock passed the ETA, long after the test started in wall time
+        self.assertGreaterEqual(min(simulation.stage_latencies['PENDING->FAILED']), 30)
+        self.assertGreater(simulation.simulated_seconds, 0.1 * 3600)  # Draining ran past the arrival window
+        stale = OrderHistory.objects.filter(to_status=Order.OrderStatus.FAILED, notes__contains='stale')
+        self.assertEqual(stale.count(), sum(report['failure_reasons'].values()))
+
+
+class DatasetGeneratorTests(TestCase):
+    end = datetime.datetime(2026, 1, 1, 12, tzinfo=datetime.timezone.utc)
+
+    def generate(self, prefix='TEST', **options):
+        # 'auto' uses COPY on PostgreSQL and bulk_create elsewhere
+        return DatasetGenerator(orders=60, products=8, locations=3, days=10, end=self.end, prefix=prefix,
+                                chunk_size=25, seed=7, **options).run()
+
+    def test_reported_counts_match_the_rows_written(self):
+        report = self.generate()
+        self.assertEqual(report['counts'], {
+            'products': Product.objects.filter(sku__startswith='TEST-').count(),
+            'locations': Location.objects.filter(code__startswith='TEST-L').count(),
+            'inventory': Inventory.objects.filter(product__sku__startswith='TEST-').count(),
+            'orders': Order.objects.count(),
+            'items': OrderItem.objects.count(),
+            'history': OrderHistory.objects.count(),
+            'allocations': Allocation.objects.count(),
+            'backorders': Backorder.objects.count(),
+        })
+        self.assertEqual(report['counts']['orders'], 60)
+        self.assertEqual(report['counts']['inventory'], 8 * 3)
+        self.assertEqual(report['rows'], sum(report['counts'].values()))
+
+    def test_rows_follow_the_order_invariants(self):
+        self.generate(status_mix={Order.OrderStatus.PACKAGING: 1, Order.OrderStatus.BACKORDERED: 1, Order.OrderStatus.DELIVERED: 1})
+        for order in Order.objects.prefetch_related('items', 'history', 'allocations', 'backorders'):
+            with self.subTest(status=order.status):
+                items = list(order.items.all())
+                self.assertEqual(order.item_count, len(items))
+                self.assertEqual(order.total_units, sum(item.quantity for item in items))
+                self.assertEqual(order.total_amount, sum(item.price_at_purchase * item.quantity for item in items))
+                history = sorted(order.history.all(), key=lambda row: row.timestamp)
+                self.assertEqual((history[0].notes, history[-1].to_status), ("Order created.", order.status))
+                self.assertEqual(order.expected_next_task_eta is not None, order.status in Order.IN_FLIGHT_STATUSES)
+                self.assertEqual(sum(a.quantity for a in order.allocations.all()),
+                                 order.total_units if order.status != Order.OrderStatus.BACKORDERED else 0)
+                self.assertEqual(order.backorders.exists(), order.status == Order.OrderStatus.BACKORDERED)
+
+    def test_diurnal_peaks_fall_on_the_hour_of_day(self):
+        # A fractional window: it starts at 04:48 and ends at midday, neither on a day boundary
+        generator = DatasetGenerator(days=2.3, end=self.end, time_distribution='diurnal', seed=7)
+        generator._prepare_sampling()
+        times = [generator._created_at() for _ in range(3000)]
+        self.assertTrue(all(generator.start <= moment < generator.end for moment in times))
+        self.assertGreater(max(times), self.end - datetime.timedelta(hours=1))  # The partial last day is covered too
+
+        hours = Counter(timezone.localtime(moment).hour for moment in times)
+        night, evening = sum(hours[h] for h in range(1, 5)), sum(hours[h] for h in range(17, 21))
+        self.assertLess(night * 5, evening)  # Weights 1 vs ~14 per hour
+
+        # Under a day: draws past `end` are redrawn, not piled up on it
+        generator = DatasetGenerator(days=0.25, end=self.end, time_distribution='diurnal', seed=7)
+        generator._prepare_sampling()
+        times = [generator._created_at() for _ in range(500)]
+        self.assertTrue(all(generator.start <= moment < generator.end for moment in times))
+        self.assertEqual(len(set(times)), len(times))
+
+        with self.assertRaises(ValueError):
+            DatasetGenerator(days=0)
+
+    def test_prefixes_can_share_a_database_but_not_be_reused(self):
+        self.generate(prefix='A')
+        self.generate(prefix='B')
+        self.assertEqual(Order.objects.count(), 120)
+        with self.assertRaises(ValueError):
+            self.generate(prefix='A')
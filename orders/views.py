@@ -1,21 +1,60 @@
-from rest_framework import viewsets, status
+import datetime
+
+from rest_framework import filters, viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.db import transaction
-from .models import Order, OrderItem, OrderHistory, Product, update_order_status
+from django.db.models import Prefetch
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema
+from .cancellation import cancel_orders
+from .clock import get_clock
+from .models import Allocation, Order, OrderItem, OrderHistory, Product, summarize_order_lines, update_order_status
 from .serializers import (
-    OrderSerializer, OrderHistorySerializer,
-    BulkOrderRequestItemSerializer, BulkOrderResponseItemSerializer
+    OrderSerializer, OrderHistorySerializer, OrderListFilterSerializer,
+    BulkOrderRequestItemSerializer, BulkOrderResponseItemSerializer,
+    OrderStatusBatchRequestSerializer, OrderStatusBatchResponseSerializer,
+    OrderCancelRequestSerializer, OrderCancelBatchRequestSerializer, OrderCancelBatchResponseSerializer,
 )
 from .tasks import process_order_task
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.prefetch_related('items', 'history').all().order_by('-created_at')
+    queryset = Order.objects.prefetch_related(
+        'items', 'history', Prefetch('allocations', queryset=Allocation.objects.select_related('inventory__location')),
+    ).all().order_by('-created_at')
     serializer_class = OrderSerializer
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['created_at', 'updated_at', 'total_amount', 'item_count', 'total_units']
+
+    # ?min_total=&max_total=&min_items=&max_items= on the list endpoint, served by the total/item indexes
+    range_filters = {
+        'min_total': 'total_amount__gte',
+        'max_total': 'total_amount__lte',
+        'min_items': 'item_count__gte',
+        'max_items': 'item_count__lte',
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = {param: value for param, value in self.request.query_params.items()
+                  if param in self.range_filters and value != ''}
+        filter_serializer = OrderListFilterSerializer(data=params)
+        filter_serializer.is_valid(raise_exception=True)
+        for param, value in filter_serializer.validated_data.items():
+            queryset = queryset.filter(**{self.range_filters[param]: value})
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create_bulk':
             return BulkOrderRequestItemSerializer # For input
+        if self.action == 'batch_status':
+            return OrderStatusBatchRequestSerializer
+        if self.action == 'cancel':
+            return OrderCancelRequestSerializer
+        if self.action == 'cancel_bulk':
+            return OrderCancelBatchRequestSerializer
         return super().get_serializer_class()
 
     # Standard create is for single order
@@ -30,6 +69,75 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer = OrderHistorySerializer(history_qs, many=True)
         return Response(serializer.data)
 
+    @extend_schema(request=OrderCancelRequestSerializer, responses=OrderSerializer)
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancel an order that has not shipped yet, releasing any stock allocated to it."""
+        order = self.get_object()
+        request_serializer = OrderCancelRequestSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result = cancel_orders([order.pk], notes=request_serializer.validated_data.get('notes') or "Order canceled.")
+        if order.pk in result['not_cancelable']:
+            return Response(
+                {'error': f"Order cannot be canceled in status {result['not_cancelable'][order.pk]}."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        order = self.get_queryset().get(pk=order.pk)
+        return Response(OrderSerializer(order).data)
+
+    # Same path segment as the detail `cancel`, so it needs its own operationId
+    @extend_schema(operation_id='orders_cancel_bulk', request=OrderCancelBatchRequestSerializer, responses=OrderCancelBatchResponseSerializer)
+    @action(detail=False, methods=['post'], url_path='cancel')
+    def cancel_bulk(self, request):
+        """
+        Cancel many orders at once (e.g. after a fraud event). Orders that have shipped, are already
+        final or don't exist are reported back rather than failing the request.
+        """
+        request_serializer = OrderCancelBatchRequestSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        result = cancel_orders(
+            request_serializer.validated_data['ids'],
+            notes=request_serializer.validated_data.get('notes') or "Order canceled in bulk.",
+        )
+        response_serializer = OrderCancelBatchResponseSerializer({
+            'canceled': result['canceled'],
+            'not_cancelable': [{'id': order_id, 'status': order_status} for order_id, order_status in result['not_cancelable'].items()],
+            'not_found': result['not_found'],
+        })
+        return Response(response_serializer.data)
+
+    # Overlap between polls: rows saved in transactions that were still open when we read
+    # may carry an updated_at just before our cutoff, so the next poll looks back this far.
+    STATUS_POLL_OVERLAP = datetime.timedelta(seconds=5)
+
+    @extend_schema(request=OrderStatusBatchRequestSerializer, responses=OrderStatusBatchResponseSerializer)
+    @action(detail=False, methods=['post'], url_path='status')
+    def batch_status(self, request):
+        """
+        Status of many orders in one indexed query (primary key lookup), without items or history.
+        With `updated_since`, only orders changed after it are returned; clients pass the returned
+        `next_updated_since` on their next poll. Unknown ids are simply absent from the result.
+        """
+        request_serializer = OrderStatusBatchRequestSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        as_of = timezone.now()
+        orders = Order.objects.filter(pk__in=request_serializer.validated_data['ids'])
+        updated_since = request_serializer.validated_data.get('updated_since')
+        if updated_since:
+            orders = orders.filter(updated_at__gt=updated_since)
+
+        response_serializer = OrderStatusBatchResponseSerializer({
+            'orders': orders.values('id', 'status', 'updated_at', 'expected_next_task_eta'),
+            'next_updated_since': as_of - self.STATUS_POLL_OVERLAP,
+        })
+        return Response(response_serializer.data)
+
     @action(detail=False, methods=['post'], url_path='bulk')
     def create_bulk(self, request):
         """
@@ -63,8 +171,9 @@ class OrderViewSet(viewsets.ModelViewSet):
                 continue
 
             try:
+                totals = summarize_order_lines((item['quantity'], item['product'].price) for item in items_data)
                 with transaction.atomic(): # Transaction for each individual order in the bulk request
-                    order = Order.objects.create(customer_name=customer_name)
+                    order = Order.objects.create(customer_name=customer_name, **totals)
                     # Log initial PENDING state
                     update_order_status(
                         order, Order.OrderStatus.PENDING, "Order created via bulk request.",
@@ -79,7 +188,7 @@ class OrderViewSet(viewsets.ModelViewSet):
                             quantity=item_data['quantity'],
                             price_at_purchase=product.price
                         )
-                    process_order_task.delay(order.id)
+                    get_clock().enqueue(process_order_task, order.id)
                     created_order_ids.append(order.id)
                     results.append({
                         "order_id": order.id,
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('priority', models.PositiveIntegerField(default=100)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='location',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='inventory_items', to='products.location'),
+        ),
+    ]
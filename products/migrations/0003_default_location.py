@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:30
+
+from django.db import migrations
+
+
+def assign_default_location(apps, schema_editor):
+    Inventory = apps.get_model('products', 'Inventory')
+    Location = apps.get_model('products', 'Location')
+    # All stock so far lived in one place
+    location, _ = Location.objects.get_or_create(code='MAIN', defaults={'name': 'Main warehouse', 'priority': 0})
+    Inventory.objects.filter(location__isnull=True).update(location=location)
+
+
+class Migration(migrations.Migration):
+    # Separate from the schema changes around it: PostgreSQL refuses to ALTER a table
+    # with pending deferred FK checks from rows updated in the same transaction
+
+    dependencies = [
+        ('products', '0002_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_default_location, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_default_location'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventory',
+            name='location',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='inventory_items', to='products.location'),
+        ),
+        migrations.AlterField(
+            model_name='inventory',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_items', to='products.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventory',
+            constraint=models.UniqueConstraint(fields=('product', 'location'), name='inventory_product_location_uniq'),
+        ),
+    ]
@@ -9,10 +9,33 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
+class Location(models.Model):
+    """A fulfilment location (warehouse, store, ...) holding its own stock of each product."""
+    DEFAULT_CODE = 'MAIN' # Created by the migration that introduced locations; holds all pre-existing stock
+
+    code = models.CharField(max_length=50, unique=True)
+    name = models.CharField(max_length=255)
+    priority = models.PositiveIntegerField(default=100) # Lower ships first (single-location-first strategy)
+    is_active = models.BooleanField(default=True) # Inactive locations keep their stock but are not allocated from
+
+    class Meta:
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return f"{self.name} ({self.code})"
+
 class Inventory(models.Model):
-    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='inventory_item')
+    """Stock of one product at one location. Orders are allocated across these rows (orders/allocation.py)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_items')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='inventory_items')
     stock_level = models.PositiveIntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # Also the index behind per-product lookups and the aggregated availability query
+            models.UniqueConstraint(fields=['product', 'location'], name='inventory_product_location_uniq'),
+        ]
+
     def __str__(self):
-        return f"Stock for {self.product.name}: {self.stock_level}"
\ No newline at end of file
+        return f"Stock for {self.product.name} at {self.location.code}: {self.stock_level}"
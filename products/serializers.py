@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Inventory, Product
+from .models import Inventory, Location, Product
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -8,13 +8,33 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'sku', 'description', 'price']
 
+class LocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Location
+        fields = ['id', 'code', 'name', 'priority', 'is_active']
+
 class InventorySerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True) # Show product details
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
     )
+    location = LocationSerializer(read_only=True)
+    location_id = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(), source='location', write_only=True
+    )
 
     class Meta:
         model = Inventory
-        fields = ['id', 'product', 'product_id', 'stock_level', 'last_updated']
-        read_only_fields = ['last_updated']
\ No newline at end of file
+        fields = ['id', 'product', 'product_id', 'location', 'location_id', 'stock_level', 'last_updated']
+        read_only_fields = ['last_updated']
+
+class InventoryAvailabilitySerializer(serializers.Serializer): # Per-product totals across locations
+    product = ProductSerializer(read_only=True)
+    stock_level = serializers.IntegerField(read_only=True) # Units at active locations
+    locations = serializers.IntegerField(read_only=True) # Active locations holding any stock
+    last_updated = serializers.DateTimeField(read_only=True)
+
+class InventoryListFilterSerializer(serializers.Serializer): # ?product=&location= on the list
+    # A non-numeric or out-of-range product id is a 400, not a 500
+    product = serializers.IntegerField(min_value=1, max_value=9223372036854775807, required=False)
+    location = serializers.CharField(max_length=50, required=False)
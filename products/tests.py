@@ -1,3 +1,111 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import Inventory, Location, Product
+
+
+class InventoryListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.main = Location.objects.get(code=Location.DEFAULT_CODE)  # Created by a migration
+        self.east = Location.objects.create(code='EAST', name="East", priority=1)
+        self.closed = Location.objects.create(code='OLD', name="Closed", priority=2, is_active=False)
+        self.widget = Product.objects.create(name="Widget", sku='WID', price='5.00')
+        self.gadget = Product.objects.create(name="Gadget", sku='GAD', price='7.00')
+        Product.objects.create(name="Not stocked", sku='NONE', price='1.00')
+        Inventory.objects.create(product=self.widget, location=self.main, stock_level=4)
+        Inventory.objects.create(product=self.widget, location=self.east, stock_level=6)
+        Inventory.objects.create(product=self.widget, location=self.closed, stock_level=100)
+        Inventory.objects.create(product=self.gadget, location=self.main, stock_level=0)
+
+    def test_availability_is_summed_over_active_locations(self):
+        response = self.client.get('/api/inventory/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['product']['sku']: row for row in response.json()}
+        self.assertEqual(list(rows), ['WID', 'GAD'])  # Products without inventory records are left out
+        self.assertEqual((rows['WID']['stock_level'], rows['WID']['locations']), (10, 2))
+        self.assertEqual((rows['GAD']['stock_level'], rows['GAD']['locations']), (0, 0))
+
+    def test_filters_list_the_per_location_records(self):
+        response = self.client.get('/api/inventory/', {'product': self.widget.pk})
+        self.assertEqual([row['location']['code'] for row in response.json()], ['MAIN', 'EAST', 'OLD'])
+
+        response = self.client.get('/api/inventory/', {'product': self.widget.pk, 'location': 'EAST'})
+        self.assertEqual([(row['product']['sku'], row['stock_level']) for row in response.json()], [('WID', 6)])
+
+        response = self.client.get('/api/inventory/', {'product': '', 'location': 'MAIN'})  # Blank filters are ignored
+        self.assertEqual([row['product']['sku'] for row in response.json()], ['WID', 'GAD'])
+
+    def test_invalid_product_filter_is_rejected(self):
+        for value in ['abc', '1.5', '0', str(2 ** 63)]:
+            with self.subTest(product=value):
+                response = self.client.get('/api/inventory/', {'product': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('product', response.json())
+
+
+@mock.patch('products.views.notify_restock')
+class RestockHookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.location = Location.objects.get(code=Location.DEFAULT_CODE)
+        self.product = Product.objects.create(name="Widget", sku='WID', price='5.00')
+        self.inventory = Inventory.objects.create(product=self.product, location=self.location, stock_level=5)
+        self.other_location = Location.objects.create(code='EAST', name="East", priority=1)
+
+    def create(self, stock_level):
+        return self.client.post('/api/inventory/', {
+            'product_id': self.product.pk, 'location_id': self.other_location.pk, 'stock_level': stock_level,
+        }, format='json')
+
+    def test_create_with_stock_notifies(self, notify_restock):
+        self.assertEqual(self.create(3).status_code, 201)
+        notify_restock.assert_called_once_with([self.product.pk])
+
+    def test_create_without_stock_does_not_notify(self, notify_restock):
+        self.assertEqual(self.create(0).status_code, 201)
+        notify_restock.assert_not_called()
+
+    def test_update_notifies_only_when_stock_rises(self, notify_restock):
+        url = f'/api/inventory/{self.inventory.pk}/'
+        self.assertEqual(self.client.patch(url, {'stock_level': 2}, format='json').status_code, 200)
+        notify_restock.assert_not_called()
+        self.assertEqual(self.client.patch(url, {'stock_level': 8}, format='json').status_code, 200)
+        notify_restock.assert_called_once_with([self.product.pk])
+
+    def test_update_stock_notifies_only_when_stock_rises(self, notify_restock):
+        url = f'/api/inventory/{self.inventory.pk}/update-stock/'
+        self.assertEqual(self.client.post(url, {'stock_level': 5}, format='json').status_code, 200)
+        self.assertEqual(self.client.post(url, {'stock_level': -1}, format='json').status_code, 400)
+        notify_restock.assert_not_called()
+        self.assertEqual(self.client.post(url, {'stock_level': 9}, format='json').status_code, 200)
+        notify_restock.assert_called_once_with([self.product.pk])
+
+
+class RestockTaskTests(TestCase):
+    def setUp(self):
+        location = Location.objects.get(code=Location.DEFAULT_CODE)
+        self.product = Product.objects.create(name="Widget", sku='WID', price='5.00')
+        self.inventory = Inventory.objects.create(product=self.product, location=location, stock_level=0)
+
+    def restock(self):
+        with mock.patch('orders.backorders.get_clock') as get_clock:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                response = APIClient().post(f'/api/inventory/{self.inventory.pk}/update-stock/', {'stock_level': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return callbacks, get_clock.return_value.enqueue
+
+    @override_settings(ORDER_BACKORDERS_ENABLED=True)
+    def test_allocation_pass_is_queued_once_the_restock_commits(self):
+        callbacks, enqueue = self.restock()
+        self.assertEqual(len(callbacks), 1)
+        [(task, product_ids)] = [call.args for call in enqueue.call_args_list]
+        self.assertEqual((task.name, product_ids), ('orders.tasks.allocate_backorders_task', [self.product.pk]))
+
+    @override_settings(ORDER_BACKORDERS_ENABLED=False)
+    def test_nothing_is_queued_without_backorders(self):
+        callbacks, enqueue = self.restock()
+        self.assertEqual(callbacks, [])
+        enqueue.assert_not_called()
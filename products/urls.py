@@ -1,10 +1,11 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import InventoryViewSet, ProductViewSet
+from .views import InventoryViewSet, LocationViewSet, ProductViewSet
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
+router.register(r'locations', LocationViewSet)
 router.register(r'inventory', InventoryViewSet)
 
 urlpatterns = [
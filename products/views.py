@@ -1,19 +1,72 @@
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Inventory, Product
-from .serializers import InventorySerializer, ProductSerializer
+from orders.backorders import notify_restock
+
+from .models import Inventory, Location, Product
+from .serializers import (
+    InventoryAvailabilitySerializer, InventoryListFilterSerializer, InventorySerializer, LocationSerializer, ProductSerializer,
+)
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+class LocationViewSet(viewsets.ModelViewSet):
+    queryset = Location.objects.all()
+    serializer_class = LocationSerializer
+
 class InventoryViewSet(viewsets.ModelViewSet):
-    queryset = Inventory.objects.select_related('product').all()
+    """
+    One record per product and location. The list shows availability per product, summed over
+    active locations in one grouped query; filter with ?product=<id> or ?location=<code> to list
+    the per-location records instead.
+    """
+    queryset = Inventory.objects.select_related('product', 'location').all().order_by('product_id', 'location__priority')
     serializer_class = InventorySerializer
 
+    def list(self, request, *args, **kwargs):
+        params = {param: value for param, value in request.query_params.items()
+                  if param in ('product', 'location') and value != ''}
+        if params:
+            filter_serializer = InventoryListFilterSerializer(data=params)
+            filter_serializer.is_valid(raise_exception=True)
+            filters = filter_serializer.validated_data
+            queryset = self.get_queryset()
+            if 'product' in filters:
+                queryset = queryset.filter(product_id=filters['product'])
+            if 'location' in filters:
+                queryset = queryset.filter(location__code=filters['location'])
+            return Response(InventorySerializer(queryset, many=True).data)
+
+        active = Q(inventory_items__location__is_active=True)
+        availability = Product.objects.filter(inventory_items__isnull=False).annotate(
+            stock_level=Coalesce(Sum('inventory_items__stock_level', filter=active), 0),
+            locations=Count('inventory_items', filter=active & Q(inventory_items__stock_level__gt=0)),
+            last_updated=Max('inventory_items__last_updated'),
+        ).order_by('id')
+        return Response(InventoryAvailabilitySerializer(
+            [{'product': product, 'stock_level': product.stock_level, 'locations': product.locations, 'last_updated': product.last_updated}
+             for product in availability],
+            many=True,
+        ).data)
+
+    # Any stock increase may let backordered orders through
+    def perform_create(self, serializer):
+        inventory_item = serializer.save()
+        if inventory_item.stock_level > 0:
+            notify_restock([inventory_item.product_id])
+
+    def perform_update(self, serializer):
+        previous_stock_level = serializer.instance.stock_level
+        inventory_item = serializer.save()
+        if inventory_item.stock_level > previous_stock_level:
+            notify_restock([inventory_item.product_id])
+
     # Custom action to update stock for a product (might be simpler than full PUT/PATCH)
     @action(detail=True, methods=['post'], url_path='update-stock')
     def update_stock(self, request, pk=None):
@@ -29,6 +82,9 @@ class InventoryViewSet(viewsets.ModelViewSet):
         except ValueError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        previous_stock_level = inventory_item.stock_level
         inventory_item.stock_level = new_stock_level
         inventory_item.save()
+        if new_stock_level > previous_stock_level:
+            notify_restock([inventory_item.product_id])
         return Response(InventorySerializer(inventory_item).data)
\ No newline at end of file